@@ -0,0 +1,558 @@
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import resource
+import string
+import sys
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+import pikepdf
+
+import convertor
+from convertor import (Chunk, ChunksPage, Entry, FontDecodersCache, IndentDetector, JsonStreamWriter,
+                       PdfDecoderForFile, PdfDecoderForFont, PdfDecoderForPage, normalise_lookup)
+
+MATICA_PDF = os.path.join(os.path.dirname(__file__), 'matica/matica-full.pdf')
+
+# the pages checked by the regression tests
+TEST_PAGES = sorted({case[1] for case in convertor.test_cases()})
+
+# a CMap of the shape OSR writes: ranges and single characters of 2-byte cids
+CMAP = b"""/CIDInit /ProcSet findresource begin
+12 dict begin
+begincmap
+1 begincodespacerange
+<0000> <FFFF>
+endcodespacerange
+2 beginbfrange
+<0020> <007E> <0020>
+<0400> <045F> <0400>
+endbfrange
+1 beginbfchar
+<1249> <0020>
+endbfchar
+endcmap
+end
+end
+"""
+
+
+def synthetic_font_decoder():
+    pdf = pikepdf.new()
+    font = pikepdf.Dictionary(Type=pikepdf.Name.Font, Subtype=pikepdf.Name.Type0,
+                              Encoding=pikepdf.Name('/Identity-H'), ToUnicode=pikepdf.Stream(pdf, CMAP))
+    fixed = {cid: chr(cid + 1) for cid in range(0x0430, 0x0450, 3)}
+    return PdfDecoderForFont('/C0_4', font, fixed)
+
+
+# PdfDecoderForFont.to_unicode before the precompiled tables, kept as the baseline
+def legacy_to_unicode(decoder, data, apply_fixups=True):
+    cids = [data[i] << 8 | data[i + 1] for i in range(0, len(data), 2)]
+    unicode_text = ""
+    for cid in cids:
+        if apply_fixups and cid in decoder.to_unicode_fixed:
+            unicode_text += decoder.to_unicode_fixed[cid]
+        elif cid in decoder.to_unicode_map:
+            unicode_text += decoder.to_unicode_map[cid]
+        else:
+            unicode_text += f"<${cid.to_bytes()}>"
+    return decoder.remove_garbage(decoder.typos.get(unicode_text, unicode_text))
+
+
+def bench_to_unicode(million_cids=1.0, chunk_len=8):
+    decoder = synthetic_font_decoder()
+    cids = list(range(0x0400, 0x0460)) + list(range(0x0020, 0x007F)) + [0x1249]
+    random.seed(0)
+    n_chunks = int(million_cids * 1_000_000 / chunk_len)
+    chunks = [b''.join(random.choice(cids).to_bytes(2, 'big') for _ in range(chunk_len)) for _ in range(n_chunks)]
+
+    def run(name, fn, repeat=3):
+        elapsed = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for chunk in chunks:
+                fn(chunk)
+            elapsed = min(elapsed, time.perf_counter() - start)
+        total = n_chunks * chunk_len / 1_000_000
+        print(f"{name:40} {elapsed / total:8.3f} s per million cids")
+
+    run("decode (original and fixed in one pass)", decoder.decode)
+    run("to_unicode(False) + to_unicode(True)", lambda c: (decoder.to_unicode(c, False), decoder.to_unicode(c)))
+    run("previous per cid implementation", lambda c: (legacy_to_unicode(decoder, c, False),
+                                                      legacy_to_unicode(decoder, c)))
+
+
+# Chunk as it was before __slots__, kept as the baseline
+class DictChunk:
+    def __init__(self, cids, text, original_text, x, y, font, dx):
+        self.cids = cids
+        self.text = text
+        self.original_text = original_text
+        self.x = float(x)
+        self.y = float(y)
+        self.font = font
+        self.dx = float(dx)
+
+
+def bench_chunk_memory(pdf_file=MATICA_PDF, f=16, t=1528):
+    # decode everything upfront, only the chunk objects are measured
+    decoded = []
+    font_decoders = FontDecodersCache()
+    with pikepdf.open(pdf_file) as pdf:
+        for n in range(f, min(t, len(pdf.pages) - 1) + 1):
+            decoder = PdfDecoderForPage(pdf.pages[n], n, font_decoders_cache=font_decoders)
+            for cids, font, x, y, dx in decoder.raw_chunks():
+                original_text, unicode_text = decoder.font_decoders[font].decode(cids)
+                decoded.append((cids, unicode_text, original_text, x, y, font, dx))
+
+    for name, cls in (("before (__dict__)", DictChunk), ("after (__slots__)", Chunk)):
+        tracemalloc.start()
+        chunks = [cls(*args) for args in decoded]
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{name:20} {size / len(chunks):8.1f} bytes per chunk, {len(chunks)} chunks")
+        del chunks
+
+
+def decode_chunks(pdf, n, font_decoders):
+    decoder = PdfDecoderForPage(pdf.pages[n], n, font_decoders_cache=font_decoders)
+    chunks = []
+    for cids, font, x, y, dx in decoder.raw_chunks():
+        original_text, unicode_text = decoder.font_decoders[font].decode(cids)
+        chunks.append(Chunk(cids, unicode_text, original_text, x, y, font, dx))
+    return chunks
+
+
+# times IndentDetector in both modes and checks they give the same dims and paragraphs
+def bench_indent_detector(pdf_file=MATICA_PDF, pages=None, repeat=20):
+    font_decoders = FontDecodersCache()
+    elapsed = {'iterative': 0.0, 'fit': 0.0}
+    mismatches = 0
+    with pikepdf.open(pdf_file) as pdf:
+        pages = [n for n in (pages or TEST_PAGES) if n < len(pdf.pages)]
+        for n in pages:
+            chunks = decode_chunks(pdf, n, font_decoders)
+            results = {}
+            for mode in elapsed:
+                convertor.indent_detector_mode = mode
+                page = ChunksPage(chunks)
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    detector = IndentDetector(page.chunks_lines_1, page.left_x_column_1,
+                                              page.chunks_lines_2, page.left_x_column_2)
+                elapsed[mode] += (time.perf_counter() - start) / repeat
+                results[mode] = (detector.min_space_indent, detector.max_space_non_indent,
+                                 detector.min_between_paragraphs, detector.max_between_lines,
+                                 len(page.chunks_paragraphs))
+            if results['iterative'] != results['fit']:
+                mismatches += 1
+                print(f"Page {n}: iterative {results['iterative']} fit {results['fit']}")
+    convertor.indent_detector_mode = 'iterative'
+    for mode, seconds in elapsed.items():
+        print(f"{mode:10} {seconds * 1000 / len(pages):8.3f} ms per page")
+    print(f"{len(pages)} pages, {mismatches} mismatches")
+    return mismatches
+
+
+class FakeRtdbHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in for the Realtime Database REST API: PUT, PATCH and DELETE of /path.json are applied to
+    server.data, GET returns it. Every request waits server.latency seconds as a network round-trip would.
+    """
+
+    def _node(self, create):
+        node = self.server.data
+        keys = [key for key in self.path.split('?')[0][:-len('.json')].split('/') if key]
+        for key in keys[:-1]:
+            node = node.setdefault(key, {}) if create else node.get(key, {})
+        return node, keys[-1] if keys else None
+
+    def _reply(self, body):
+        time.sleep(self.server.latency)
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        return json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'null')
+
+    def do_GET(self):
+        node, key = self._node(False)
+        with self.server.lock:
+            self._reply(node.get(key) if key else node)
+
+    def do_PUT(self):
+        body = self._body()
+        with self.server.lock:
+            node, key = self._node(True)
+            node[key] = body
+            self.server.requests += 1
+        self._reply(body)
+
+    def do_PATCH(self):
+        body = self._body()
+        with self.server.lock:
+            node, key = self._node(True)
+            node.setdefault(key, {}).update(body)
+            self.server.requests += 1
+        self._reply(body)
+
+    def do_DELETE(self):
+        with self.server.lock:
+            node, key = self._node(False)
+            node.pop(key, None)
+            self.server.requests += 1
+        self._reply(None)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_rtdb(latency):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeRtdbHandler)
+    server.data = {}
+    server.lock = Lock()
+    server.latency = latency
+    server.requests = 0
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# pages f..t, every step-th of them, or sample of them picked at random
+def sample_pages(pdf_file, f, t, step=1, sample=None):
+    with pikepdf.open(pdf_file) as pdf:
+        pages = list(range(f, min(t, len(pdf.pages) - 1) + 1, step))
+    if sample is not None and sample < len(pages):
+        random.seed(0)
+        pages = sorted(random.sample(pages, sample))
+    return pages
+
+
+# Times the stages of the conversion of the pages: walking the content stream, decoding the cids,
+# the layout (ChunksPage), the entries (headword_and_body) and writing them as JSON
+def bench_pipeline(pdf_file=MATICA_PDF, pages=None):
+    stages = {'walk': 0.0, 'decode': 0.0, 'layout': 0.0, 'entries': 0.0, 'output': 0.0}
+    n_chunks = 0
+    n_entries = 0
+    font_decoders = FontDecodersCache()
+    out = io.StringIO()
+    writer = JsonStreamWriter(out)
+    start = time.perf_counter()
+    with pikepdf.open(pdf_file) as pdf:
+        for n in pages:
+            decoder = PdfDecoderForPage(pdf.pages[n], n, convertor.fixes, convertor.typos, font_decoders)
+            entries = decoder.convert_to_entries([])
+            n_chunks += len(decoder.raw_chunks())
+            for stage, seconds in decoder.timings.items():
+                stages[stage] += seconds
+            output_start = time.perf_counter()
+            for entry in entries:
+                writer.write(PdfDecoderForFile._json_record(entry, True))
+            stages['output'] += time.perf_counter() - output_start
+            n_entries += len(entries)
+    writer.close()
+    elapsed = time.perf_counter() - start
+    return {
+        'pages': len(pages),
+        'chunks': n_chunks,
+        'entries': n_entries,
+        'seconds': elapsed,
+        'pages_per_second': len(pages) / elapsed,
+        'entries_per_second': n_entries / elapsed,
+        'stages': stages,
+        # kilobytes on Linux
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'python': platform.python_version(),
+        'layout': convertor.layout_engine,
+        'indent_detector': convertor.indent_detector_mode,
+    }
+
+
+def print_pipeline(result):
+    print(f"{result['pages']} pages, {result['chunks']} chunks, {result['entries']} entries in {result['seconds']:.2f} s: "
+          f"{result['pages_per_second']:.1f} pages/s, {result['entries_per_second']:.0f} entries/s, "
+          f"peak RSS {result['peak_rss_kb'] / 1024:.0f} MB")
+    total = sum(result['stages'].values()) or 1
+    for stage, seconds in result['stages'].items():
+        print(f"  {stage:8} {seconds:8.3f} s {seconds * 100 / total:5.1f}%")
+
+
+# stages slower than in the baseline by more than tolerance (0.1 is 10%), compared per page
+def pipeline_regressions(result, baseline, tolerance):
+    regressions = []
+    for stage, seconds in result['stages'].items():
+        if stage not in baseline['stages']:
+            continue
+        now = seconds / result['pages']
+        before = baseline['stages'][stage] / baseline['pages']
+        if now > before * (1 + tolerance):
+            regressions.append(f"{stage}: {before * 1000:.2f} -> {now * 1000:.2f} ms per page")
+    return regressions
+
+
+# loading the fixups file, and applying the fixups to a font as a reload does against parsing the font again
+def bench_fixups(path=convertor.FIXUPS_FILE, repeat=20):
+    pdf = pikepdf.new()
+    font = pikepdf.Dictionary(Type=pikepdf.Name.Font, Subtype=pikepdf.Name.Type0,
+                              Encoding=pikepdf.Name('/Identity-H'), ToUnicode=pikepdf.Stream(pdf, CMAP))
+    fixed, typos = convertor.fixes.get('/C0_4', {}), convertor.typos.get('/C0_4', {})
+    decoder = PdfDecoderForFont('/C0_4', font, fixed, typos)
+
+    def run(name, fn):
+        elapsed = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            elapsed = min(elapsed, time.perf_counter() - start)
+        print(f"{name:32} {elapsed * 1000:8.3f} ms")
+
+    run("load_fixups", lambda: convertor.load_fixups(path))
+    run("font parsed (cache miss)", lambda: PdfDecoderForFont('/C0_4', font, fixed, typos))
+    run("fixups refreshed (reload)", lambda: decoder.set_fixups(fixed, typos))
+
+
+# Chunk.has_leading_glitches before GlitchTable, kept as the baseline
+def legacy_has_leading_glitches(chunk):
+    return (False
+            or chunk.startswith(b'\n"', '/C0_3')
+            or chunk.startswith(b'\n"', '/C0_5')
+            or chunk.startswith(b'\x00~', '/C0_0')
+            or chunk.startswith(b'\x01*', '/C0_3')
+            or chunk.startswith(b'\x007', '/C0_3')
+            or chunk.startswith(b'\x01\x9d', '/C0_8')
+            or chunk.startswith(b'\x01\xaf', '/C0_5')
+            or chunk.startswith(b'\x01\xe1', '/C0_0')
+            or chunk.startswith(b'\x01\xf9', '/C0_0')
+            or chunk.startswith(b'\x02\x94', '/C0_0')
+            or chunk.startswith(b'\x03*', '/C0_0')
+            or chunk.startswith(b'\x03*', '/C0_5')
+            or chunk.startswith(b'\x03\x0c', '/C0_10')
+            or chunk.startswith('.')
+            or chunk.startswith(','))
+
+
+# every chunk of the pages checked for a leading glitch as before and by the GlitchTable
+def bench_glitches(pdf_file=MATICA_PDF, f=16, t=1528, repeat=5):
+    font_decoders = FontDecodersCache()
+    with pikepdf.open(pdf_file) as pdf:
+        chunks = [chunk for n in range(f, min(t, len(pdf.pages) - 1) + 1)
+                  for chunk in decode_chunks(pdf, n, font_decoders)]
+
+    def run(name, fn):
+        elapsed = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            found = [fn(chunk) for chunk in chunks]
+            elapsed = min(elapsed, time.perf_counter() - start)
+        print(f"{name:32} {elapsed * 1e9 / len(chunks):8.1f} ns per chunk")
+        return found
+
+    before = run("startswith per glitch", legacy_has_leading_glitches)
+    after = run("GlitchTable", Chunk.has_leading_glitches)
+    print(f"{len(chunks)} chunks, {sum(after)} with a leading glitch")
+    return before == after
+
+
+# PdfDecoderForFile.lookup_translator before normalise_lookup, kept as the baseline
+_legacy_lookup_translator = str.maketrans('', '', string.punctuation)
+
+
+def legacy_lookup(s):
+    return s.replace(' ', '').translate(_legacy_lookup_translator).lower()
+
+
+# the lookup keys of the decoded entries: per entry as before, per entry with normalise_lookup,
+# per page in one pass and read back from the cache, every way has to give the same keys
+def bench_lookups(pdf_file=MATICA_PDF, f=16, t=1528, repeat=5):
+    pages = {}
+    for entry in PdfDecoderForFile(pdf_file).iter_entries(f, t):
+        pages.setdefault(entry.page_no, []).append(entry)
+    entries = [entry for page in pages.values() for entry in page]
+    expected = [(legacy_lookup(e.headword + e.definition), legacy_lookup(e.headword)) for e in entries]
+
+    def fresh():
+        for entry in entries:
+            entry._lookup = None
+            entry._headword_lookup = None
+
+    def run(name, fn, reset=True):
+        elapsed = float('inf')
+        for _ in range(repeat):
+            if reset:
+                fresh()
+            start = time.perf_counter()
+            keys = fn()
+            elapsed = min(elapsed, time.perf_counter() - start)
+        print(f"{name:32} {elapsed * 1000:8.2f} ms, {elapsed * 1e6 / len(entries):6.2f} us per entry")
+        return keys == expected
+
+    def bulk():
+        for page in pages.values():
+            Entry.compute_lookups(page)
+        return [(e.lookup, e.headword_lookup) for e in entries]
+
+    same = [
+        run("previous lookup_translator", lambda: [(legacy_lookup(e.headword + e.definition),
+                                                    legacy_lookup(e.headword)) for e in entries]),
+        run("normalise_lookup per entry", lambda: [(normalise_lookup(e.headword + e.definition),
+                                                    normalise_lookup(e.headword)) for e in entries]),
+        run("Entry.compute_lookups per page", bulk),
+        run("cached lookup, headword_lookup", lambda: [(e.lookup, e.headword_lookup) for e in entries], reset=False),
+    ]
+    print(f"{len(entries)} entries, {len(pages)} pages")
+    return all(same)
+
+
+# exports into the fake database through the emulator support of firebase_admin
+# with use_async the export goes through AsyncExportEngine and the REST API
+def bench_firebase(pdf_file=MATICA_PDF, f=16, t=1528, batch_size=convertor.FIREBASE_BATCH_SIZE,
+                   workers=convertor.FIREBASE_WORKERS, latency=0.05, use_async=False):
+    server = start_fake_rtdb(latency)
+    os.environ['FIREBASE_DATABASE_EMULATOR_HOST'] = f"127.0.0.1:{server.server_port}"
+    start = time.perf_counter()
+    decoder = convertor.PdfDecoderForFile(pdf_file)
+    if use_async:
+        exported = decoder.export_firebase_async(None, f, t, batch_size, workers)
+    else:
+        exported = decoder.export_firebase(None, f, t, batch_size, workers)
+    elapsed = time.perf_counter() - start
+    stored = len(server.data.get('entries', {}))
+    print(f"{'async' if use_async else 'threads'} batch {batch_size:5}, workers {workers:3}: {elapsed:6.2f} s, "
+          f"{exported / elapsed:8.0f} entries/s, "
+          f"{server.requests} requests, {stored} entries stored")
+    server.shutdown()
+    return stored == exported
+
+
+# exports into a scratch database of a local mongod, the database is dropped afterwards
+def bench_mongodb(connection_string, pdf_file=MATICA_PDF, f=16, t=1528, batch_size=convertor.MONGODB_BATCH_SIZE,
+                  workers=convertor.ASYNC_WRITERS, use_async=False):
+    from pymongo import MongoClient
+
+    database = 'matica_benchmark'
+    start = time.perf_counter()
+    decoder = convertor.PdfDecoderForFile(pdf_file)
+    if use_async:
+        exported = decoder.export_mongodb_async(connection_string, f, t, batch_size, workers, database)
+    else:
+        exported = decoder.export_mongodb(connection_string, f, t, batch_size, database)
+    elapsed = time.perf_counter() - start
+    client = MongoClient(connection_string)
+    collection = client[database].entries
+    stored = collection.count_documents({})
+    indexes = sorted(collection.index_information())
+    print(f"batch {batch_size:5}: {elapsed:6.2f} s, {exported / elapsed:8.0f} entries/s, {stored} entries stored, "
+          f"indexes {', '.join(indexes)}")
+    client.drop_database(database)
+    client.close()
+    return stored == exported
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Мерење брзине конвертора')
+    parser.add_argument('--to-unicode', action='store_true',
+                        help='Брзина декодирања CID-ова у Unicode')
+    parser.add_argument('--chunk-memory', action='store_true',
+                        help='Меморија по делу (Chunk) на опсегу страна')
+    parser.add_argument('--indent-detector', action='store_true',
+                        help='Поређење начина рада IndentDetector на странама из тестова')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Времена фаза конверзије, стране и уноси у секунди, највећа меморија')
+    parser.add_argument('--layout', choices=['python', 'numpy'], default='python',
+                        help='Алгоритам за одређивање линија, колона и пасуса за --pipeline')
+    parser.add_argument('--fit', action='store_true',
+                        help='IndentDetector у fit начину рада за --pipeline')
+    parser.add_argument('--step', type=int, default=1,
+                        help='Свака step-та страна у опсегу --from..--to')
+    parser.add_argument('--sample', type=int, default=None,
+                        help='Број насумично изабраних страна из опсега')
+    parser.add_argument('--save', default=None,
+                        help='JSON фајл за резултате --pipeline')
+    parser.add_argument('--compare', default=None,
+                        help='JSON фајл ранијих резултата --pipeline, излаз са грешком при успорењу')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Дозвољено успорење фазе према --compare (0.1 је 10%%)')
+    parser.add_argument('--fixups', action='store_true',
+                        help='Брзина учитавања фајла исправки и њихове примене на фонт')
+    parser.add_argument('--glitches', action='store_true',
+                        help='Брзина провере OSR грешака на почетку делова')
+    parser.add_argument('--lookups', action='store_true',
+                        help='Брзина нормализације одредница и кључева за претрагу (lookup)')
+    parser.add_argument('--firebase', action='store_true',
+                        help='Извоз у лажну firebase базу на локалном HTTP серверу')
+    parser.add_argument('--mongodb', default=None,
+                        help='Извоз у привремену базу локалног mongod: --mongodb mongodb://localhost:27017')
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help='Број уноса по једном упису у firebase или mongodb')
+    parser.add_argument('--workers', type=int, default=convertor.FIREBASE_WORKERS,
+                        help='Број истовремених уписа у firebase')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='Извоз у firebase или mongodb истовремено са конверзијом (asyncio)')
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='Кашњење лажне firebase базе по захтеву у секундама')
+    parser.add_argument('--pdf', default=MATICA_PDF,
+                        help='PDF фајл')
+    parser.add_argument('--from', dest='f', type=int, default=16,
+                        help='Прва страна')
+    parser.add_argument('--to', dest='t', type=int, default=1528,
+                        help='Последња страна')
+    parser.add_argument('--million-cids', type=float, default=1.0,
+                        help='Број CID-ова у милионима')
+
+    args = parser.parse_args()
+
+    if args.to_unicode:
+        bench_to_unicode(args.million_cids)
+
+    if args.chunk_memory:
+        bench_chunk_memory(args.pdf, args.f, args.t)
+
+    if args.pipeline:
+        convertor.layout_engine = args.layout
+        convertor.indent_detector_mode = 'fit' if args.fit else 'iterative'
+        result = bench_pipeline(args.pdf, sample_pages(args.pdf, args.f, args.t, args.step, args.sample))
+        print_pipeline(result)
+        if args.save:
+            with open(args.save, 'w', encoding='utf-8') as f:
+                json.dump(result, f, indent=2)
+        if args.compare:
+            with open(args.compare, encoding='utf-8') as f:
+                regressions = pipeline_regressions(result, json.load(f), args.tolerance)
+            for regression in regressions:
+                print(f"Slower {regression}", file=sys.stderr)
+            if len(regressions) > 0:
+                exit(1)
+
+    if args.fixups:
+        bench_fixups()
+
+    if args.glitches:
+        if not bench_glitches(args.pdf, args.f, args.t):
+            exit(1)
+
+    if args.lookups:
+        if not bench_lookups(args.pdf, args.f, args.t):
+            exit(1)
+
+    if args.firebase:
+        if not bench_firebase(args.pdf, args.f, args.t, args.batch_size or convertor.FIREBASE_BATCH_SIZE,
+                              args.workers, args.latency, args.use_async):
+            exit(1)
+
+    if args.mongodb:
+        if not bench_mongodb(args.mongodb, args.pdf, args.f, args.t, args.batch_size or convertor.MONGODB_BATCH_SIZE,
+                             args.workers, args.use_async):
+            exit(1)
+
+    if args.indent_detector:
+        if bench_indent_detector(args.pdf) > 0:
+            exit(1)
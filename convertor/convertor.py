@@ -1,11 +1,24 @@
+import bisect
+import asyncio
+import hashlib
+import io
+from array import array
+from contextlib import nullcontext, redirect_stdout
 import json
 import os
+import pickle
+import sqlite3
 import string
+import sys
+import time
+from threading import Event
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from typing import List
 
 import pikepdf
 import re
 
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 from uuid import uuid4
 
@@ -22,6 +35,48 @@ DEBUG_LINES = False
 DEBUG_GLITCHES = False
 
 debug_progress = False
+debug_timings = False
+
+# 'python' or 'numpy', see NumpyLayout
+layout_engine = 'python'
+# 'iterative' or 'fit', see IndentDetector
+indent_detector_mode = 'iterative'
+
+# ChunksCache shared by all the page decoders, None disables caching
+chunks_cache = None
+
+# Counters of the run, None disables counting
+counters = None
+
+
+class Counters:
+    """
+    Counters of the conversion: pages, chunks, cids decoded, cids without mapping (rendered as <$...>),
+    cids decoded by the fixups, glitches removed and the threshold iterations of IndentDetector.
+    They are collected only when the module global counters is set, the call sites check it for None
+    so that a run without counters does not pay for them.
+    """
+
+    NAMES = ('pages', 'chunks', 'cids', 'unknown_cids', 'fixups', 'glitches', 'indent_iterations')
+
+    def __init__(self):
+        self.values = dict.fromkeys(self.NAMES, 0)
+        self.start = time.perf_counter()
+
+    def add(self, name, n=1):
+        self.values[name] = self.values.get(name, 0) + n
+
+    def merge(self, values):
+        for name, n in values.items():
+            self.add(name, n)
+
+    # machine readable report, timings are the seconds per stage of PdfDecoderForFile
+    def report(self, timings):
+        return {'elapsed': time.perf_counter() - self.start, 'timings': dict(timings), 'counters': dict(self.values)}
+
+    def save(self, path, timings):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(timings), f, indent=2)
 
 
 def string_to_cids(string, encoding_type):
@@ -86,22 +141,22 @@ def is_se_brackets(text):
     return False
 
 
+# texts of the chunks with the neighbours of the same font joined, се starts a new text
 def _concat_chunks_by_same_font(chunks):
-    chunksx = []
-    prev_chunk = None
-    for chunk in chunks:
-        if chunk == 'indent':  # hack, assuming this never will be called in the context requiring indent
-            continue
-        if prev_chunk is None:
-            prev_chunk = chunk.copy()
-        elif prev_chunk.font == chunk.font and not (is_se(chunk.text) or is_se_brackets(chunk.text)):
-            prev_chunk.text += chunk.text
+    # hack, assuming this never will be called in the context requiring indent
+    return _concat_texts_by_same_font((chunk.font, chunk.text) for chunk in chunks if chunk != 'indent')
+
+
+def _concat_texts_by_same_font(fonts_texts):
+    texts = []
+    prev_font = None
+    for font, text in fonts_texts:
+        if len(texts) > 0 and prev_font == font and not (is_se(text) or is_se_brackets(text)):
+            texts[-1] += text
         else:
-            chunksx.append(prev_chunk)
-            prev_chunk = chunk.copy()
-    if prev_chunk is not None:
-        chunksx.append(prev_chunk)
-    return chunksx
+            texts.append(text)
+            prev_font = font
+    return texts
 
 
 HYPHEN = chr(173)
@@ -199,16 +254,13 @@ class ChunksParagraph:
             body = re.sub(pattern, r'\1', body)
             return body
 
+        # the passes work on (font, text) pairs, the chunks of the page are not copied
         removed_hyphens = self._get_without_hyphens(self.lines)
-        all_chunks = []
-        for line in removed_hyphens:
-            all_chunks += line
-        concatenated = _concat_chunks_by_same_font(all_chunks)
+        concatenated = _concat_texts_by_same_font(removed_hyphens)
         cyrillic_fixed = self._fix_cyrillic_i(concatenated)
-        para_chunks = cyrillic_fixed
 
         # join all chunks and divide by space to get words
-        para_words = ' '.join(chunk.text for chunk in para_chunks).split()
+        para_words = ' '.join(cyrillic_fixed).split()
 
         # assume no headword
         if len(para_words) == 0:
@@ -312,41 +364,41 @@ class ChunksParagraph:
 
         return headword, r(para_words)
 
+    # (font, text) of all the chunks of the lines, the hyphens at the ends of the lines removed
     @staticmethod
     def _get_without_hyphens(lines):
-        linesx = []
         for line in lines:
-            last_chunk = line[-1]
-            if last_chunk.text.endswith(HYPHEN):
-                chunkx = last_chunk.copy()
-                chunkx.text = last_chunk.text[:-1]
-                linesx.append(line[:-1] + [chunkx])
-            else:
-                linesx.append(line)
-        return linesx
+            last = len(line) - 1
+            for i, chunk in enumerate(line):
+                if i == last and chunk.text.endswith(HYPHEN):
+                    yield chunk.font, chunk.text[:-1]
+                else:
+                    yield chunk.font, chunk.text
 
     @staticmethod
-    def _fix_cyrillic_i(chunks):
-        chunksx = []
-        for i in range(len(chunks)):
-            chunk = chunks[i].copy()
-            chunk.text = _word_lat_to_cyr(chunk.text)
-            chunksx.append(chunk)
-        return chunksx
+    def _fix_cyrillic_i(texts):
+        return [_word_lat_to_cyr(text) for text in texts]
 
 
 class IndentDetector:
-    def __init__(self, lines_1, left_x_1, lines_2, left_x_2):
+    """
+    Evaluates the indents and the intervals between lines and paragraphs of the page columns.
+    The 'iterative' mode walks the lines relaxing the thresholds by 0.1 until they produce a value,
+    the 'fit' mode gets the same values from a single pass over the lines.
+    """
+
+    def __init__(self, lines_1, left_x_1, lines_2, left_x_2, mode=None):
         self.max_between_lines = 0
         self.min_between_paragraphs = 1000
         self.max_space_non_indent = 0
         self.min_space_indent = 1000
+        set_dims = self._fit_dims if (mode or indent_detector_mode) == 'fit' else self._set_dims
         if DEBUG_INDENT:
             print(f"set dim column 1:", file=sys.stderr)
-        self._set_dims(lines_1, left_x_1)
+        set_dims(lines_1, left_x_1)
         if DEBUG_INDENT:
             print(f"set dim column 2:", file=sys.stderr)
-        self._set_dims(lines_2, left_x_2)
+        set_dims(lines_2, left_x_2)
         if self.min_space_indent == 1000:
             raise ValueError('Cannot evaluate min_space_indent')
         if self.max_space_non_indent == 0:
@@ -364,8 +416,10 @@ class IndentDetector:
         _max_space_non_indent = 0
         _min_between_paragraphs = 1000
         _max_between_lines = 0
+        iterations = 0
 
         while _min_space_indent == 1000 or _max_space_non_indent == 0:
+            iterations += 1
             if DEBUG_INDENT:
                 print(f"traversing lines from 1 to {len(lines)}",
                       file=sys.stderr)
@@ -474,6 +528,11 @@ class IndentDetector:
                     if DEBUG_INDENT:
                         print(f"newline threshold set to {newline}", file=sys.stderr)
 
+        if counters is not None:
+            counters.add('indent_iterations', iterations)
+        self._merge_dims(_min_space_indent, _max_space_non_indent, _min_between_paragraphs, _max_between_lines)
+
+    def _merge_dims(self, _min_space_indent, _max_space_non_indent, _min_between_paragraphs, _max_between_lines):
         if _min_space_indent < self.min_space_indent:
             self.min_space_indent = _min_space_indent
         if _max_space_non_indent > self.max_space_non_indent:
@@ -483,6 +542,54 @@ class IndentDetector:
         if _max_between_lines > self.max_between_lines:
             self.max_between_lines = _max_between_lines
 
+    # The same dims as _set_dims evaluates, from the indent/interval pairs of the lines collected once.
+    # Only the thresholds are stepped the way _set_dims steps them, no more passes over the lines.
+    def _fit_dims(self, lines, left):
+        non_ident = 6
+        indent = 12
+        indent_hard_mark = 8
+        newline = 10
+        para = 12
+        interval_hard_mark = 11
+
+        # (indent space, interval from the previous line) of every line
+        dims = [(lines[i][0].x - left, lines[i - 1][0].y - lines[i][0].y) for i in range(1, len(lines))]
+
+        # a big indent is a new paragraph, a small one is a new line, whatever the thresholds are
+        _min_between_paragraphs = min([1000] + [dy for dx, dy in dims if dx > indent and dy >= interval_hard_mark])
+        _max_between_lines = max([0] + [dy for dx, dy in dims if dx < non_ident and dy <= interval_hard_mark])
+
+        # candidates which can set min_space_indent/max_space_non_indent once the thresholds let them in
+        indents = [(dx, dy) for dx, dy in dims if indent_hard_mark <= dx < 1000]
+        non_indents = [(dx, dy) for dx, dy in dims if 0 < dx <= indent_hard_mark and abs(dy) > 4]
+        max_indent_dy = max((dy for dx, dy in indents), default=None)
+        min_non_indent_dy = min((dy for dx, dy in non_indents), default=None)
+
+        iterations = 0
+        while True:
+            iterations += 1
+            indent_set = max_indent_dy is not None and max_indent_dy > para
+            non_indent_set = min_non_indent_dy is not None and min_non_indent_dy < newline
+            if indent_set and non_indent_set:
+                break
+            if not indent_set:
+                para -= 0.1
+                if para < interval_hard_mark:
+                    break
+            if not non_indent_set:
+                newline += 0.1
+                if newline > interval_hard_mark:
+                    break
+
+        _min_space_indent = min([1000] + [dx for dx, dy in indents if dy > para]) if indent_set else 1000
+        _max_space_non_indent = max([0] + [dx for dx, dy in non_indents if dy < newline]) if non_indent_set else 0
+        if DEBUG_INDENT:
+            print(f"fit: para threshold {para}, newline threshold {newline}", file=sys.stderr)
+        if counters is not None:
+            counters.add('indent_iterations', iterations)
+
+        self._merge_dims(_min_space_indent, _max_space_non_indent, _min_between_paragraphs, _max_between_lines)
+
 
 class ChunksPage:
     def __init__(self, chunks):
@@ -526,8 +633,8 @@ class ChunksPage:
         self._set_paragraphs()
 
     def title(self):
-        chunks = _concat_chunks_by_same_font(self.chunks_title)
-        result = ' '.join(chunk.text.strip() for chunk in chunks)
+        texts = _concat_chunks_by_same_font(self.chunks_title)
+        result = ' '.join(text.strip() for text in texts)
         return result
 
     def _set_title_and_page(self):
@@ -545,11 +652,18 @@ class ChunksPage:
                 print(f"chunk[{i}]: {str(self.chunks_page[i])}", file=sys.stderr)
 
     def _set_lines(self):
-        self.chunks_lines = self._get_lines(self.chunks_page)
+        if layout_engine == 'numpy':
+            self.chunks_lines = NumpyLayout.get_lines(self.chunks_page)
+        else:
+            self.chunks_lines = self._get_lines(self.chunks_page)
 
     def _set_columns(self):
         if len(self.chunks_lines) == 0:
             return
+        if layout_engine == 'numpy':
+            self.left_x_column_1, self.left_x_column_2, self.chunks_lines_1, self.chunks_lines_2 = (
+                NumpyLayout.get_columns(self.chunks_lines))
+            return
         left_xs = [self.chunks_lines[0][0].x, 1000]
         columns = [[self.chunks_lines[0]], []]
         current_column = 0
@@ -594,8 +708,9 @@ class ChunksPage:
             print(f"  .min_space_indent={indentDetector.min_space_indent}", file=sys.stderr)
             print(f"  .max_between_lines={indentDetector.max_between_lines}", file=sys.stderr)
             print(f"  .min_between_paragraphs={indentDetector.min_between_paragraphs}", file=sys.stderr)
-        self.indented_lines_1 = self._get_indented_lines(indentDetector, self.chunks_lines_1, self.left_x_column_1)
-        self.indented_lines_2 = self._get_indented_lines(indentDetector, self.chunks_lines_2, self.left_x_column_2)
+        get_indented_lines = NumpyLayout.get_indented_lines if layout_engine == 'numpy' else self._get_indented_lines
+        self.indented_lines_1 = get_indented_lines(indentDetector, self.chunks_lines_1, self.left_x_column_1)
+        self.indented_lines_2 = get_indented_lines(indentDetector, self.chunks_lines_2, self.left_x_column_2)
 
     def _set_paragraphs(self):
         paragraphs1 = self._get_paragraphs_lines(self.chunks_lines_1, self.indented_lines_1)
@@ -626,6 +741,8 @@ class ChunksPage:
     @staticmethod
     def remove_leading_glitches(chunks):
         while len(chunks) > 0 and chunks[0].has_leading_glitches():
+            if counters is not None:
+                counters.add('glitches')
             cleaned_chunk = chunks[0].copy_without_first_2bytes()
             if cleaned_chunk.is_empty():
                 chunks = chunks[1:]
@@ -749,29 +866,7 @@ class ChunksPage:
 
         chunk = test[0][0]
 
-        glitch = (True
-                  or chunk.cids.__bytes__() == b'\x00\\\x12I'
-                  or chunk.cids.__bytes__() == b'\x00\x14'
-                  or chunk.cids.__bytes__() == b'\x00\x7f\x12I'
-                  or chunk.cids.__bytes__() == b'\x00\xbb\x01='
-                  or chunk.cids.__bytes__() == b'\x01\x88\x02\xf2'
-                  or chunk.cids.__bytes__() == b'\x02|\x02\x84'
-                  or chunk.cids.__bytes__() == b'\x01I\x01\xb8'
-                  or chunk.cids.__bytes__() == b'\x02\x80\x04\xed'
-                  or chunk.cids.__bytes__() == b'\x02\xb2\x12I'
-                  or chunk.cids.__bytes__() == b'\x02\xe8\x06\x0e'
-                  or chunk.cids.__bytes__() == b'\x02\xe9\x06\x0e'
-                  or chunk.cids.__bytes__() == b'\x02\xeb\x06\x0e'
-                  or chunk.cids.__bytes__() == b'\x02\xed\x06\x0e'
-                  or chunk.cids.__bytes__() == b'\x02%\x04F'
-                  or chunk.cids.__bytes__() == b'\x02n\x02o\x02\x84'
-                  or chunk.cids.__bytes__() == b'\x02x\x04\xed'
-                  or chunk.cids.__bytes__() == b'\x02z\x04\xed'
-                  or chunk.cids.__bytes__() == b'\x03!'
-                  or chunk.cids.__bytes__() == b'\x04\xaa'
-                  or chunk.cids.__bytes__() == b'\x03w\x03}'
-                  )
-        return not glitch
+        return not glitches.is_line(chunk)
 
     @staticmethod
     def _get_top_left_bak(chunks):
@@ -788,6 +883,133 @@ class ChunksPage:
         return top, left
 
 
+class NumpyLayout:
+    """
+    The layout stages of ChunksPage computed over the x/y arrays of a page with NumPy.
+    Every method returns exactly what its ChunksPage counterpart does: _get_lines, _set_columns
+    and _get_indented_lines. NumPy is optional, it is imported only when this engine is selected.
+    """
+
+    @staticmethod
+    def get_lines(chunks):
+        import numpy as np
+
+        if len(chunks) == 0:
+            return []
+        y = np.fromiter((chunk.y for chunk in chunks), dtype=float, count=len(chunks))
+        # NewLineDetector: a new line starts where y differs from the previous chunk by 1 or more
+        starts = (np.flatnonzero(np.abs(np.diff(y)) >= 1) + 1).tolist()
+        ends = starts[1:] + [len(chunks)]
+
+        lines = []
+        line = chunks[:starts[0]] if len(starts) > 0 else list(chunks)
+        for start, end in zip(starts, ends):
+            line = ChunksPage.remove_leading_glitches(line)
+            if len(line) == 0:
+                # as _get_lines does, the chunk starting the line is dropped together with the glitch
+                line = chunks[start + 1:end]
+                continue
+            lines.append(line)
+            line = chunks[start:end]
+        if len(line) > 0:
+            lines.append(line)
+        return lines
+
+    # returns left_x_column_1, left_x_column_2, chunks_lines_1, chunks_lines_2
+    @staticmethod
+    def get_columns(lines):
+        import numpy as np
+
+        n = len(lines)
+        x = np.fromiter((line[0].x for line in lines), dtype=float, count=n)
+        y = np.fromiter((line[0].y for line in lines), dtype=float, count=n)
+        dy = np.zeros(n)
+        dy[1:] = y[1:] - y[:-1]
+        column = np.zeros(n, dtype=np.int8)
+        left_xs = [lines[0][0].x, 1000]
+
+        # the state changes only a few times per page, every run of lines in the same column is one vector step
+        current_column = 0
+        i = 1
+        while i < n:
+            if current_column == 0:
+                # the second column starts with a leap above the current line, a leap below is an error
+                leaps = np.flatnonzero(np.abs(dy[i:]) > 30)
+                j = i + int(leaps[0]) if len(leaps) > 0 else n
+                if j > i:
+                    left_xs[0] = min(left_xs[0], float(x[i:j].min()))
+                if j == n:
+                    break
+                if dy[j] < -30:
+                    raise ValueError(f"Unexpected column: {current_column}")
+                column[j] = 1
+                left_xs[1] = min(left_xs[1], float(x[j]))
+                current_column = 1
+                i = j + 1
+            else:
+                # back to the first column with a leap to the left of the leftmost line of the second column
+                lefts = np.minimum.accumulate(np.concatenate(([left_xs[1]], x[i:])))[:-1]
+                leaps = np.flatnonzero(x[i:] < lefts - 100)
+                k = i + int(leaps[0]) if len(leaps) > 0 else n
+                if k > i:
+                    column[i:k] = 1
+                    left_xs[1] = min(left_xs[1], float(x[i:k].min()))
+                if k == n:
+                    break
+                left_xs[0] = min(left_xs[0], float(x[k]))
+                current_column = 0
+                i = k + 1
+
+        lines_1 = [lines[i] for i in np.flatnonzero(column == 0).tolist()]
+        lines_2 = [lines[i] for i in np.flatnonzero(column == 1).tolist()]
+        return left_xs[0], left_xs[1], lines_1, lines_2
+
+    @staticmethod
+    def get_indented_lines(indentDetector, lines, left_x):
+        import numpy as np
+
+        id = indentDetector
+        middle_space = id.max_space_non_indent + (id.min_space_indent - id.max_space_non_indent) / 2
+        middle_interval = id.max_between_lines + (id.min_between_paragraphs - id.max_between_lines) / 2
+        if len(lines) == 0:
+            return {}
+        if middle_space == 0 or middle_interval == 0:
+            # let the python path raise the same ZeroDivisionError
+            return ChunksPage._get_indented_lines(indentDetector, lines, left_x)
+
+        n = len(lines)
+        x = np.fromiter((line[0].x for line in lines), dtype=float, count=n)
+        y = np.fromiter((line[0].y for line in lines), dtype=float, count=n)
+
+        space = x - left_x
+        likely_non_indent = space < middle_space
+        logit_non_indent = np.where(likely_non_indent, (middle_space - space) / middle_space, 0)
+        logit_indent = np.where(likely_non_indent, 0, (space - middle_space) / middle_space)
+
+        interval = np.zeros(n)
+        interval[1:] = y[:-1] - y[1:]
+        interval = np.minimum(interval, middle_interval * 2)
+        likely_new_line = interval <= middle_interval
+        logit_new_line = np.where(likely_new_line, (middle_interval - interval) / middle_interval, 0)
+        logit_paragraph = np.where(likely_new_line, 0, (interval - middle_interval) / middle_interval)
+        logit_new_line[0] = 0
+        logit_paragraph[0] = 0
+
+        weight_indent = 1
+        weight_paragraph = 2
+
+        non_indent = ((logit_non_indent * weight_indent) * (logit_non_indent * weight_indent) +
+                      (logit_new_line * weight_paragraph) * (logit_new_line * weight_paragraph))
+
+        indent = ((logit_indent * weight_indent) * (logit_indent * weight_indent) +
+                  (logit_paragraph * weight_paragraph) * (logit_paragraph * weight_paragraph))
+
+        ties = np.flatnonzero(indent == non_indent)
+        if len(ties) > 0:
+            raise ValueError(f"Unexpected indent: {indent[ties[0]]}")
+        return dict(enumerate((indent > non_indent).tolist()))
+
+
 class PdfDecoderForFont():
     def __init__(self, font_name, font, to_unicode_fixed=None, typos=None):
         self.name = font_name
@@ -830,18 +1052,61 @@ class PdfDecoderForFont():
                         cid = int(char_match.group(1), 16)
                         bytes_string = bytes.fromhex(char_match.group(2))
                         self.to_unicode_map[cid] = bytes_string.decode('utf-16be', errors='ignore')
-        # Fixups  Unicode CMap
-        self.to_unicode_fixed = to_unicode_fixed or {}
-        self.typos = typos or {}
+        # dense tables indexed by cid with and without the fixups, None stands for the cids without mapping
+        size = 0x100 if self.encoding_type == ENCODING_TYPE_1B else 0x10000
+        self._table_original = [None] * size
+        for cid, text in self.to_unicode_map.items():
+            if cid < size:
+                self._table_original[cid] = text
+        self.set_fixups(to_unicode_fixed, typos)
+
+    # Fixups  Unicode CMap; copied, so the decoder can tell the fixups it was built with have changed since
+    def set_fixups(self, to_unicode_fixed, typos):
+        self.to_unicode_fixed = dict(to_unicode_fixed or {})
+        self.typos = dict(typos or {})
+        size = len(self._table_original)
+        self._table_fixed = list(self._table_original)
+        for cid, text in self.to_unicode_fixed.items():
+            if cid < size:
+                self._table_fixed[cid] = text
+
+    def has_fixups(self, to_unicode_fixed, typos):
+        return self.to_unicode_fixed == (to_unicode_fixed or {}) and self.typos == (typos or {})
+
+    def cids(self, data):
+        if self.encoding_type == ENCODING_TYPE_1B:
+            return array('B', data)
+        # 2-byte big-endian codes both for Identity-H and Identity-V
+        cids = array('H', data)
+        if sys.byteorder == 'little':
+            cids.byteswap()
+        return cids
+
+    # decodes the string shown by Tj/TJ both without and with the fixups applied: (original_text, unicode_text)
+    def decode(self, pikepdf_string):
+        data = pikepdf_string if isinstance(pikepdf_string, (bytes, bytearray)) else pikepdf_string.__bytes__()
+        cids = self.cids(data)
+        try:
+            original_text = ''.join(map(self._table_original.__getitem__, cids))
+            unicode_text = ''.join(map(self._table_fixed.__getitem__, cids))
+        except TypeError:
+            # a cid without mapping, let the slow path render the placeholders
+            original_text = self._cids_to_text(cids, False)
+            unicode_text = self._cids_to_text(cids, True)
+        return (self.remove_garbage(self.typos.get(original_text, original_text)),
+                self.remove_garbage(self.typos.get(unicode_text, unicode_text)))
 
     def to_unicode(self, pikepdf_string, apply_fixups=True):
-        bytes = pikepdf_string.__bytes__()
-        if self.encoding_type == ENCODING_TYPE_2B:
-            cids = [bytes[i] << 8 | bytes[i + 1] for i in range(0, len(bytes), 2)]
-        elif self.encoding_type == ENCODING_TYPE_MB:
-            cids = [bytes[i] << 8 | bytes[i + 1] for i in range(0, len(bytes), 2)]
-        else:
-            cids = [byte for byte in bytes]
+        data = pikepdf_string if isinstance(pikepdf_string, (bytes, bytearray)) else pikepdf_string.__bytes__()
+        cids = self.cids(data)
+        table = self._table_fixed if apply_fixups else self._table_original
+        try:
+            unicode_text = ''.join(map(table.__getitem__, cids))
+        except TypeError:
+            unicode_text = self._cids_to_text(cids, apply_fixups)
+        return self.remove_garbage(self.typos.get(unicode_text, unicode_text))
+
+    def _cids_to_text(self, cids, apply_fixups):
         unicode_text = ""
         for cid in cids:
             try:
@@ -854,19 +1119,364 @@ class PdfDecoderForFont():
             except (OverflowError, ValueError) as e:
                 unicode_text += "?"
                 print(f"====> Error decoding CID {cid} to Unicode: {e}")
-        return self.remove_garbage(self.typos.get(unicode_text, unicode_text))
+        return unicode_text
 
     def remove_garbage(self, text):
         return text.replace('.м', 'м')  # //.replace('ЈЬ','љ')
 
 
+class ChunksCache:
+    """
+    On-disk cache of the raw chunks (cids, font, x, y, dx) of the pages.
+    The key is a hash of the page content stream, so the cache survives edits of the fixups and
+    the layout heuristics and is invalidated only when the PDF itself changes.
+    """
+    VERSION = 1
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def content_hash(page):
+        contents = page.get("/Contents")
+        if contents is None:
+            streams = []
+        elif isinstance(contents, pikepdf.Array):
+            streams = contents
+        else:
+            streams = [contents]
+        h = hashlib.sha1(f"v{ChunksCache.VERSION}".encode())
+        for stream in streams:
+            h.update(stream.read_raw_bytes())
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pickle")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def put(self, key, raw_chunks):
+        # write to a temporary file first, the cache can be shared by several worker processes
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            pickle.dump(raw_chunks, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+
+class RawChunksDatabase:
+    """
+    SQLite database of the raw data read from the PDF: the pages, every chunk shown on them with the cids,
+    positions and the texts without and with the fixups, and the ToUnicode mappings of the fonts along with
+    the fixups. The chunks outside the paragraphs (the title, the glitches dropped by the layout) have no
+    paragraph, line and position. The cids of the chunks are indexed by (font, cid) and the chunks
+    by (page, paragraph), so the questions like "which pages show /C0_4 cid 0x0ce4" are index lookups.
+    """
+    # kept as user_version, a database of another version is created anew
+    VERSION = 2
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS pages (
+            page INTEGER PRIMARY KEY,
+            title TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS lines (
+            page INTEGER NOT NULL,
+            paragraph INTEGER NOT NULL,
+            line INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            PRIMARY KEY (page, paragraph, line)
+        );
+        CREATE TABLE IF NOT EXISTS chunks (
+            id INTEGER PRIMARY KEY,
+            page INTEGER NOT NULL,
+            paragraph INTEGER,
+            line INTEGER,
+            position INTEGER,
+            font TEXT NOT NULL,
+            cids BLOB NOT NULL,
+            x REAL NOT NULL,
+            y REAL NOT NULL,
+            dx REAL NOT NULL,
+            original_text TEXT NOT NULL,
+            text TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS chunks_page_paragraph ON chunks (page, paragraph);
+        CREATE TABLE IF NOT EXISTS chunk_cids (
+            chunk INTEGER NOT NULL REFERENCES chunks (id),
+            font TEXT NOT NULL,
+            cid INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS chunk_cids_font_cid ON chunk_cids (font, cid);
+        CREATE TABLE IF NOT EXISTS mappings (
+            font TEXT NOT NULL,
+            cid INTEGER NOT NULL,
+            unicode TEXT,
+            fixed TEXT,
+            PRIMARY KEY (font, cid)
+        );
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] != self.VERSION:
+            with self.connection:
+                for table in ('chunk_cids', 'chunks', 'lines', 'pages', 'mappings'):
+                    self.connection.execute(f"DROP TABLE IF EXISTS {table}")
+        self.connection.executescript(self.SCHEMA)
+        self.connection.execute(f"PRAGMA user_version = {self.VERSION}")
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    # drops everything written before, the database is rebuilt from scratch
+    def clear(self):
+        with self.connection:
+            for table in ('chunk_cids', 'chunks', 'lines', 'pages', 'mappings'):
+                self.connection.execute(f"DELETE FROM {table}")
+
+    # every raw chunk of the page (PdfDecoderForPage.raw_chunks) in the page order, the ones found in the paragraphs
+    # with their paragraph, line and position; the cids are split as font_decoders[font] splits them.
+    # A chunk the layout has cut a leading glitch off is stored as read, with the glitch.
+    def add_page(self, page_no, title, paragraphs, font_decoders, raw_chunks):
+        # the layout keeps the position of a chunk, also of the one it has cut
+        placed = {}
+        for para_no, paragraph in enumerate(paragraphs):
+            for line_no, line in enumerate(paragraph.lines):
+                for position, chunk in enumerate(line):
+                    placed.setdefault((chunk.font, chunk.x, chunk.y, chunk.dx), []).append(
+                        (para_no, line_no, position))
+        with self.connection:
+            cursor = self.connection.cursor()
+            cursor.execute("INSERT OR REPLACE INTO pages VALUES (?, ?)", (page_no, title))
+            for para_no, paragraph in enumerate(paragraphs):
+                for line_no, line in enumerate(paragraph.lines):
+                    cursor.execute("INSERT OR REPLACE INTO lines VALUES (?, ?, ?, ?)",
+                                   (page_no, para_no, line_no, ''.join(chunk.text for chunk in line)))
+            for cids, font, x, y, dx in raw_chunks:
+                places = placed.get((font, x, y, dx))
+                para_no, line_no, position = places.pop(0) if places else (None, None, None)
+                original_text, text = font_decoders[font].decode(cids)
+                cursor.execute("INSERT INTO chunks (page, paragraph, line, position, font, cids, x, y, dx,"
+                               " original_text, text) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                               (page_no, para_no, line_no, position, font, cids, x, y, dx, original_text, text))
+                chunk_id = cursor.lastrowid
+                cursor.executemany("INSERT INTO chunk_cids VALUES (?, ?, ?)",
+                                   ((chunk_id, font, cid) for cid in set(font_decoders[font].cids(cids))))
+
+    # the ToUnicode mapping of the font and its fixups, the cids with a fixup only have no unicode
+    def add_mappings(self, font_decoder):
+        cids = set(font_decoder.to_unicode_map) | set(font_decoder.to_unicode_fixed)
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO mappings VALUES (?, ?, ?, ?)",
+                ((font_decoder.name, cid, font_decoder.to_unicode_map.get(cid), font_decoder.to_unicode_fixed.get(cid))
+                 for cid in sorted(cids)))
+
+    def pages_with_cid(self, font, cid):
+        return [row['page'] for row in self.connection.execute(
+            "SELECT DISTINCT chunks.page FROM chunk_cids JOIN chunks ON chunks.id = chunk_cids.chunk"
+            " WHERE chunk_cids.font = ? AND chunk_cids.cid = ? ORDER BY chunks.page", (font, cid))]
+
+    def chunks_with_cid(self, font, cid):
+        return self.connection.execute(
+            "SELECT chunks.* FROM chunk_cids JOIN chunks ON chunks.id = chunk_cids.chunk"
+            " WHERE chunk_cids.font = ? AND chunk_cids.cid = ? ORDER BY chunks.id", (font, cid)).fetchall()
+
+    def paragraph_chunks(self, page_no, para_no):
+        return self.connection.execute(
+            "SELECT * FROM chunks WHERE page = ? AND paragraph = ? ORDER BY line, position",
+            (page_no, para_no)).fetchall()
+
+    def paragraph_lines(self, page_no, para_no):
+        return [row['text'] for row in self.connection.execute(
+            "SELECT text FROM lines WHERE page = ? AND paragraph = ? ORDER BY line", (page_no, para_no))]
+
+    # (unicode, fixed) of the cid of the font, None if the font has no such cid
+    def mapping(self, font, cid):
+        row = self.connection.execute("SELECT unicode, fixed FROM mappings WHERE font = ? AND cid = ?",
+                                      (font, cid)).fetchone()
+        return None if row is None else (row['unicode'], row['fixed'])
+
+    def title(self, page_no):
+        row = self.connection.execute("SELECT title FROM pages WHERE page = ?", (page_no,)).fetchone()
+        return None if row is None else row['title']
+
+
+class FontDecodersCache:
+    """
+    PdfDecoderForFont shared by the pages of one file. The pages of the book refer to the same font objects,
+    so the ToUnicode CMap of each font is parsed once per file instead of once per page.
+    The fonts are keyed by the object id (objgen) and the resource name the fixups are bound to.
+    A cached decoder asked for with other fixups (see reload_fixups) rebuilds its fixed table only.
+    """
+
+    def __init__(self):
+        self.decoders = {}
+        self.hits = 0
+        self.misses = 0
+        self.refreshed = 0
+
+    def get(self, font_name, font, to_unicode_fixed, typos):
+        objgen = font.objgen
+        # a direct object has no identity to be keyed by
+        if objgen == (0, 0):
+            self.misses += 1
+            return PdfDecoderForFont(font_name, font, to_unicode_fixed, typos)
+        key = (objgen, font_name)
+        decoder = self.decoders.get(key)
+        if decoder is None:
+            self.misses += 1
+            decoder = PdfDecoderForFont(font_name, font, to_unicode_fixed, typos)
+            self.decoders[key] = decoder
+        else:
+            self.hits += 1
+            if not decoder.has_fixups(to_unicode_fixed, typos):
+                self.refreshed += 1
+                decoder.set_fixups(to_unicode_fixed, typos)
+        return decoder
+
+    def __str__(self):
+        return f"font decoders: {self.hits} hits, {self.misses} misses (parsed), {self.refreshed} refreshed fixups"
+
+
+class ContentStreamWalker:
+    """
+    Walks the text operators of a page content stream and calls lmbd(text, font_decoder, x, y, dx)
+    for every string shown by Tj/TJ. Only the operators in OPERATORS are materialised by the parser,
+    they are dispatched by name through HANDLERS.
+    """
+    OPERATORS = 'BT ET Td TD TL T* Tf Tj TJ Tm'
+
+    def __init__(self, font_decoders, lmbd):
+        self.font_decoders = font_decoders
+        self.lmbd = lmbd
+        self.intext = False
+        self.font = None
+        self.x = 0
+        self.y = 0
+        self.dx = 1000
+
+    def walk(self, page):
+        handlers = self.HANDLERS
+        for operands, operator in pikepdf.parse_content_stream(page, self.OPERATORS):
+            if DEBUG_PDF:
+                print(f'Operator: {operator}', file=sys.stderr)
+            handlers[str(operator)](self, operands)
+
+    def _bt(self, operands):
+        self.intext = True
+        self.font = None
+        self.dx = 1000
+
+    def _et(self, operands):
+        self.intext = False
+        self.font = None
+
+    def _td(self, operands):
+        self.dx = operands[0]
+        self.x += operands[0]
+        self.y += operands[1]
+        if DEBUG_PDF:
+            print(f"Td: dx={self.dx} x={operands[0]} y={operands[1]}", file=sys.stderr)
+
+    # Tc and Tw are not taken into account, they do not move the start of a string
+
+    def _td_leading(self, operands):
+        raise ValueError("Unexpected operator TD")
+
+    def _tl(self, operands):
+        raise ValueError("Unexpected operator TL")
+
+    def _t_star(self, operands):
+        raise ValueError("Unexpected operator T*")
+
+    def _tf(self, operands):
+        if self.intext:
+            self.font = str(operands[0])
+
+    def _tj(self, operands):
+        if not self.intext:
+            return
+        for operand in operands:
+            if isinstance(operand, pikepdf.String):
+                self._show(operand, 'Tj')
+            else:
+                print(f"Unexpected operand type: {type(operand)}")
+
+    def _tj_array(self, operands):
+        if not self.intext:
+            return
+        for operand in operands:
+            if isinstance(operand, pikepdf.Array):
+                for element in operand:
+                    if isinstance(element, pikepdf.String):
+                        self._show(element, 'TJ')
+                    elif DEBUG_PDF or not isinstance(element, (int, Decimal)):
+                        self._debug_tj_element(element)
+            else:
+                print(f"Unexpected operand type: {type(operand)}")
+
+    def _debug_tj_element(self, element):
+        if isinstance(element, int):
+            print(f"TJ: x={self.x} y={self.y} int={element} -> \"{element}\", Font: {self.font}", file=sys.stderr)
+        elif isinstance(element, Decimal):
+            print(f"TJ: x={self.x} y={self.y} Decimal={element} -> \"{element}\", Font: {self.font}",
+                  file=sys.stderr)
+        else:
+            print(f"Unexpected element type: {type(element)}")
+
+    def _tm(self, operands):
+        if not self.intext:
+            return
+        if DEBUG_PDF:
+            print(
+                f"Tm: 0={operands[0]} 1={operands[1]} 2={operands[2]} 3={operands[3]} 4={operands[4]} 5={operands[5]}",
+                file=sys.stderr)
+        self.x = operands[4]
+        self.dx = 1000
+        self.y = operands[5]
+
+    def _show(self, text, operator):
+        font_decoder = self.font_decoders[self.font]
+        if DEBUG_PDF:
+            print(
+                f"{operator}: x={self.x} y={self.y} {text.__bytes__()} -> \"{font_decoder.to_unicode(text)}\", Font: {font_decoder.name}",
+                file=sys.stderr)
+        self.lmbd(text, font_decoder, self.x, self.y, self.dx)
+
+    HANDLERS = {
+        'BT': _bt,
+        'ET': _et,
+        'Td': _td,
+        'TD': _td_leading,
+        'TL': _tl,
+        'T*': _t_star,
+        'Tf': _tf,
+        'Tj': _tj,
+        'TJ': _tj_array,
+        'Tm': _tm,
+    }
+
+
 class PdfDecoderForPage():
-    def __init__(self, page, page_no, to_unicode_fixed=None, typos=None):
+    def __init__(self, page, page_no, to_unicode_fixed=None, typos=None, font_decoders_cache=None):
         if to_unicode_fixed is None:
             to_unicode_fixed = {}
         self.page = page
         self.page_no = page_no
+        self._raw_chunks = None
         self._chunks_page = None
+        # seconds spent in the stages: content stream walking, decoding of cids, layout, entries
+        self.timings = {'walk': 0.0, 'decode': 0.0, 'layout': 0.0, 'entries': 0.0}
         self.resources = page["/Resources"]
         self.fonts = self.resources.get("/Font", None)
         self.font_decoders = {}
@@ -876,132 +1486,14 @@ class PdfDecoderForPage():
             for font_name, font_dict in self.fonts.items():
                 font = font_dict
                 fixed = (to_unicode_fixed or {}).get(font_name, {})
-                self.font_decoders[font_name] = PdfDecoderForFont(font_name, font, fixed,
-                                                                  (typos or {}).get(font_name, {}))
+                font_typos = (typos or {}).get(font_name, {})
+                if font_decoders_cache is None:
+                    self.font_decoders[font_name] = PdfDecoderForFont(font_name, font, fixed, font_typos)
+                else:
+                    self.font_decoders[font_name] = font_decoders_cache.get(font_name, font, fixed, font_typos)
 
     def _call_for_tj(self, lmbd):
-        intext = False
-        font = None
-        x = 0
-        y = 0
-        dx = 1000
-        for operands, operator in pikepdf.parse_content_stream(self.page):
-            # debug code
-            #            print(f" ==== > Operator: {operator}", "Operands: ", operands)
-            #            if operator == pikepdf.Operator('Tj'):
-            #                for operand in operands:
-            #                    if isinstance(operand, pikepdf.String):
-            #                        text = operand
-            #                        font_decoder = self.font_decoders[font]
-            #                        self.lmbd_debug(text, font_decoder, x, y)
-            #                    else:
-            #                        print(f"Unexpected operand type: {type(operand)}")
-            #            elif operator == pikepdf.Operator('TJ'):
-            #                for operand in operands:
-            #                    if isinstance(operand, pikepdf.Array):
-            #                        for element in operand:
-            #                            if isinstance(element, pikepdf.String):
-            #                                text = element
-            #                                font_decoder = self.font_decoders[font]
-            #                                self.lmbd_debug(text, font_decoder, x, y)
-            #                            elif isinstance(element, int):
-            #                                pass
-            #                            elif isinstance(element, Decimal):
-            #                                pass
-            #                            else:
-            #                                print(f"Unexpected element type: {type(element)}")
-            #                    else:
-            #                        print(f"Unexpected operand type: {type(operand)}")
-            if DEBUG_PDF:
-                print(f'Operator: {operator}', file=sys.stderr)
-
-            if operator == pikepdf.Operator('BT'):
-                intext = True
-                font = None
-                dx = 1000
-                continue
-            if operator == pikepdf.Operator('ET'):
-                intext = False
-                font = None
-                continue
-            # if operator == pikepdf.Operator('Tc'):
-            #    x += operands[0] * words length
-            #    continue
-            # if operator == pikepdf.Operator('Tw'):
-            #    x += operands[0]
-            #    continue
-            if operator == pikepdf.Operator('TL'):
-                raise ValueError("Unexpected operator TL")
-            if operator == pikepdf.Operator('TD'):
-                raise ValueError("Unexpected operator TD")
-            if operator == pikepdf.Operator('Td'):
-                dx = operands[0]
-                x += operands[0]
-                y += operands[1]
-                if DEBUG_PDF:
-                    print(f"Td: dx={dx} x={operands[0]} y={operands[1]}", file=sys.stderr)
-                continue
-            if operator == pikepdf.Operator('T*'):
-                raise ValueError("Unexpected operator T*")
-            if operator == pikepdf.Operator('TL'):
-                raise ValueError("Unexpected operator TL")
-            if intext:
-                if operator == pikepdf.Operator('Tf'):
-                    font = str(operands[0])
-                elif operator == pikepdf.Operator('Tj'):
-                    for operand in operands:
-                        if isinstance(operand, pikepdf.String):
-                            text = operand
-                            font_decoder = self.font_decoders[font]
-                            if DEBUG_PDF:
-                                print(
-                                    f"Tj: x={x} y={y} {text.__bytes__()} -> \"{font_decoder.to_unicode(text)}\", Font: {font_decoder.name}",
-                                    file=sys.stderr)
-                            lmbd(text, font_decoder, x, y, dx)
-                        else:
-                            print(f"Unexpected operand type: {type(operand)}")
-                elif operator == pikepdf.Operator('TJ'):
-                    for operand in operands:
-                        if isinstance(operand, pikepdf.Array):
-                            for element in operand:
-                                if isinstance(element, pikepdf.String):
-                                    text = element
-                                    font_decoder = self.font_decoders[font]
-                                    if DEBUG_PDF:
-                                        print(
-                                            f"TJ: x={x} y={y} {text.__bytes__()} -> \"{font_decoder.to_unicode(text)}\", Font: {font_decoder.name}",
-                                            file=sys.stderr)
-                                    lmbd(text, font_decoder, x, y, dx)
-                                elif isinstance(element, int):
-                                    if DEBUG_PDF:
-                                        print(
-                                            f"TJ: x={x} y={y} int={element} -> \"{element}\", Font: {font}",
-                                            file=sys.stderr)
-                                    pass
-                                elif isinstance(element, Decimal):
-                                    if DEBUG_PDF:
-                                        print(
-                                            f"TJ: x={x} y={y} Decimal={element} -> \"{element}\", Font: {font}",
-                                            file=sys.stderr)
-                                    pass
-                                else:
-                                    print(f"Unexpected element type: {type(element)}")
-                        else:
-                            print(f"Unexpected operand type: {type(operand)}")
-                elif operator == pikepdf.Operator('Tm'):
-                    if DEBUG_PDF:
-                        print(
-                            f"Tm: 0={operands[0]} 1={operands[1]} 2={operands[2]} 3={operands[3]} 4={operands[4]} 5={operands[5]}",
-                            file=sys.stderr)
-                    x0 = operands[4]
-                    if abs(x0 - x) > -1:
-                        # raise ValueError(f"Unexpected operator Tm {self.page_no} x {x} x0 {x0}")
-                        x = x0
-                        dx = 1000
-                    y0 = operands[5]
-                    if abs(y0 - y) > -1:
-                        # raise ValueError(f"Unexpected operator Tm {self.page_no} y {y} y0 {y0}")
-                        y = operands[5]
+        ContentStreamWalker(self.font_decoders, lmbd).walk(self.page)
 
     @staticmethod
     def lmbd_debug(text, font_decoder, x, y, dx):
@@ -1011,22 +1503,70 @@ class PdfDecoderForPage():
     def debug_text(self):
         self._call_for_tj(self.lmbd_debug)
 
-    # TODO: static method?
-    def convert_to_chunks_page(self):
-        chunks = []
+    # (cids, font, x, y, dx) of every string shown on the page, before decoding
+    def raw_chunks(self):
+        if self._raw_chunks is not None:
+            return self._raw_chunks
+        start = time.perf_counter()
+        if chunks_cache is None:
+            raw_chunks = self._read_raw_chunks()
+        else:
+            key = ChunksCache.content_hash(self.page)
+            raw_chunks = chunks_cache.get(key)
+            if raw_chunks is None:
+                raw_chunks = self._read_raw_chunks()
+                chunks_cache.put(key, raw_chunks)
+        self._raw_chunks = raw_chunks
+        self.timings['walk'] += time.perf_counter() - start
+        return raw_chunks
+
+    def _read_raw_chunks(self):
+        raw_chunks = []
 
         def lmbd(text, font_decoder, x, y, dx):
-            nonlocal chunks
-            original_text = font_decoder.to_unicode(text, False)
-            unicode_text = font_decoder.to_unicode(text)
-            chunks.append(Chunk(text, unicode_text, original_text, x, y, font_decoder.name, dx))
+            raw_chunks.append((text.__bytes__(), font_decoder.name, float(x), float(y), float(dx)))
 
         self._call_for_tj(lmbd)
+        return raw_chunks
 
-        if self._chunks_page is None:
-            self._chunks_page = ChunksPage(chunks)
+    # {font name: set of cids} shown on the page
+    def used_cids(self):
+        used = {}
+        for cids, font, _, _, _ in self.raw_chunks():
+            used.setdefault(font, set()).update(self.font_decoders[font].cids(cids))
+        return used
+
+    # TODO: static method?
+    def convert_to_chunks_page(self):
+        if self._chunks_page is not None:
+            return self._chunks_page
+        chunks = []
+        raw_chunks = self.raw_chunks()
+        start = time.perf_counter()
+        for cids, font, x, y, dx in raw_chunks:
+            original_text, unicode_text = self.font_decoders[font].decode(cids)
+            chunks.append(Chunk(cids, unicode_text, original_text, x, y, font, dx))
+        decoded = time.perf_counter()
+        self.timings['decode'] += decoded - start
+        if counters is not None:
+            self._count_chunks(chunks)
+
+        self._chunks_page = ChunksPage(chunks)
+        self.timings['layout'] += time.perf_counter() - decoded
         return self._chunks_page
 
+    def _count_chunks(self, chunks):
+        counters.add('pages')
+        counters.add('chunks', len(chunks))
+        for chunk in chunks:
+            font_decoder = self.font_decoders[chunk.font]
+            cids = font_decoder.cids(chunk.cids)
+            counters.add('cids', len(cids))
+            fixed = font_decoder.to_unicode_fixed
+            known = font_decoder.to_unicode_map
+            counters.add('fixups', sum(1 for cid in cids if cid in fixed))
+            counters.add('unknown_cids', sum(1 for cid in cids if cid not in fixed and cid not in known))
+
     @staticmethod
     def _paragraphs_to_entries(paragraphs, page_no):
         entries = []
@@ -1044,13 +1584,20 @@ class PdfDecoderForPage():
             self._chunks_page = self.convert_to_chunks_page()
         chunks_page = self._chunks_page
 
+        start = time.perf_counter()
         entries = PdfDecoderForPage._paragraphs_to_entries(chunks_page.chunks_paragraphs, self.page_no)
+        self.timings['entries'] += time.perf_counter() - start
+
+        return PdfDecoderForPage.join_continuation(prev_entries, entries)
 
+    # the first entry without headword is a continuation of the last entry on the previous page,
+    # its definition is appended to that entry and the entry itself is dropped
+    @staticmethod
+    def join_continuation(prev_entries, entries):
         if len(prev_entries) > 0:
             if not entries[0].headword:
-                prev_entries[-1].definition += entries[0].definition
+                prev_entries[-1].append_definition(entries[0].definition)
                 entries = entries[1:]
-
         return entries
 
     def title(self):
@@ -1060,6 +1607,9 @@ class PdfDecoderForPage():
 
 
 class Chunk:
+    # a page has thousands of chunks, no per-instance __dict__
+    __slots__ = ('cids', 'text', 'original_text', 'x', 'y', 'font', 'dx')
+
     def __init__(self, cids, text, original_text, x, y, font, dx):
         if isinstance(cids, bytes):
             self.cids = cids
@@ -1069,7 +1619,8 @@ class Chunk:
         self.original_text = original_text
         self.x = float(x)
         self.y = float(y)
-        self.font = font
+        # the font names read from the cache are not shared strings otherwise
+        self.font = sys.intern(font)
         self.dx = float(dx)
 
     def __str__(self):
@@ -1104,23 +1655,158 @@ class Chunk:
             return self.text.startswith(char)
 
     def has_leading_glitches(self):
-        res = (False
-               or self.startswith(b'\n"', '/C0_3')
-               or self.startswith(b'\n"', '/C0_5')
-               or self.startswith(b'\x00~', '/C0_0')
-               or self.startswith(b'\x01*', '/C0_3')
-               or self.startswith(b'\x007', '/C0_3')
-               or self.startswith(b'\x01\x9d', '/C0_8')
-               or self.startswith(b'\x01\xaf', '/C0_5')
-               or self.startswith(b'\x01\xe1', '/C0_0')
-               or self.startswith(b'\x01\xf9', '/C0_0')
-               or self.startswith(b'\x02\x94', '/C0_0')
-               or self.startswith(b'\x03*', '/C0_0')
-               or self.startswith(b'\x03*', '/C0_5')
-               or self.startswith(b'\x03\x0c', '/C0_10')
-               or self.startswith('.')
-               or self.startswith(','))
-        return res
+        return glitches.is_leading(self)
+
+
+# The OSR glitches: (font, cids prefix) of a chunk the page or line starts with, font None for any font,
+# or a text prefix; the glitch is removed by 2 bytes (see ChunksPage.remove_leading_glitches)
+LEADING_GLITCHES = [
+    ('/C0_3', b'\n"'),
+    ('/C0_5', b'\n"'),
+    ('/C0_0', b'\x00~'),
+    ('/C0_3', b'\x01*'),
+    ('/C0_3', b'\x007'),
+    ('/C0_8', b'\x01\x9d'),
+    ('/C0_5', b'\x01\xaf'),
+    ('/C0_0', b'\x01\xe1'),
+    ('/C0_0', b'\x01\xf9'),
+    ('/C0_0', b'\x02\x94'),
+    ('/C0_0', b'\x03*'),
+    ('/C0_5', b'\x03*'),
+    ('/C0_10', b'\x03\x0c'),
+    (None, '.'),
+    (None, ','),
+]
+
+# the cids of the known lines of one chunk OSR leaves as separate paragraphs (see ChunksPage.no_osr_glitch_line)
+GLITCH_LINES = [
+    b'\x00\\\x12I',
+    b'\x00\x14',
+    b'\x00\x7f\x12I',
+    b'\x00\xbb\x01=',
+    b'\x01\x88\x02\xf2',
+    b'\x02|\x02\x84',
+    b'\x01I\x01\xb8',
+    b'\x02\x80\x04\xed',
+    b'\x02\xb2\x12I',
+    b'\x02\xe8\x06\x0e',
+    b'\x02\xe9\x06\x0e',
+    b'\x02\xeb\x06\x0e',
+    b'\x02\xed\x06\x0e',
+    b'\x02%\x04F',
+    b'\x02n\x02o\x02\x84',
+    b'\x02x\x04\xed',
+    b'\x02z\x04\xed',
+    b'\x03!',
+    b'\x04\xaa',
+    b'\x03w\x03}',
+]
+
+
+class GlitchTable:
+    """
+    LEADING_GLITCHES and GLITCH_LINES compiled into sets of prefixes by font and prefix length, so a chunk is
+    checked by a few set probes instead of a startswith per glitch. More glitches are added from a JSON file:
+
+        {"leading": [{"font": "/C0_3", "cids": "0a22"}, {"text": "."}],
+         "lines": ["005c1249"],
+         "any_single_chunk_line": true}
+
+    cids are hex as in --cid, a leading glitch without font matches any font.
+    """
+
+    def __init__(self, leading=(), lines=(), any_single_chunk_line=True):
+        # font -> {prefix length -> prefixes}
+        self.cids_prefixes = {}
+        # prefix length -> prefixes
+        self.text_prefixes = {}
+        self.lines = set()
+        # font -> ((length, prefixes), ...) of the font, the ones of any font and the text ones, built on first use
+        self._probes = {}
+        # every paragraph of one line of one chunk is dropped as a glitch, not only the known lines
+        self.any_single_chunk_line = any_single_chunk_line
+        for font, prefix in leading:
+            self.add_leading(font, prefix)
+        for cids in lines:
+            self.lines.add(cids)
+
+    def add_leading(self, font, prefix):
+        if isinstance(prefix, bytes):
+            self.cids_prefixes.setdefault(font, {}).setdefault(len(prefix), set()).add(prefix)
+        else:
+            self.text_prefixes.setdefault(len(prefix), set()).add(prefix)
+        self._probes = {}
+
+    def is_leading(self, chunk):
+        probes = self._probes.get(chunk.font)
+        if probes is None:
+            probes = self._compile(chunk.font)
+        cids_probes, text_probes = probes
+        for length, prefixes in cids_probes:
+            if chunk.cids[:length] in prefixes:
+                return True
+        for length, prefixes in text_probes:
+            if chunk.text[:length] in prefixes:
+                return True
+        return False
+
+    def _compile(self, font):
+        by_length = {}
+        for f in (font, None):
+            for length, prefixes in self.cids_prefixes.get(f, {}).items():
+                by_length.setdefault(length, set()).update(prefixes)
+        probes = (tuple((length, frozenset(prefixes)) for length, prefixes in by_length.items()),
+                  tuple((length, frozenset(prefixes)) for length, prefixes in self.text_prefixes.items()))
+        self._probes[font] = probes
+        return probes
+
+    def is_line(self, chunk):
+        return self.any_single_chunk_line or chunk.cids in self.lines
+
+    def extend(self, path):
+        with open(path, encoding='utf-8') as f:
+            table = json.load(f)
+        for glitch in table.get('leading', []):
+            if 'text' in glitch:
+                self.add_leading(None, glitch['text'])
+            else:
+                self.add_leading(glitch.get('font'), bytes.fromhex(glitch['cids']))
+        for cids in table.get('lines', []):
+            self.lines.add(bytes.fromhex(cids))
+        self.any_single_chunk_line = table.get('any_single_chunk_line', self.any_single_chunk_line)
+
+    # JSON-able and order independent, kept in the state of the incremental conversion
+    def state(self):
+        return {
+            'leading': sorted(f"{font}:{prefix.hex()}" for font, by_length in self.cids_prefixes.items()
+                              for prefixes in by_length.values() for prefix in prefixes) +
+                       sorted(f"text:{prefix}" for prefixes in self.text_prefixes.values() for prefix in prefixes),
+            'lines': sorted(cids.hex() for cids in self.lines),
+            'any_single_chunk_line': self.any_single_chunk_line,
+        }
+
+
+# the glitches of the run, extended by --glitches
+glitches = GlitchTable(LEADING_GLITCHES, GLITCH_LINES)
+
+
+# spaces and punctuation are dropped from the lookup keys; a regex is faster than str.translate
+# on the cyrillic text which makes translate look up every character in the table
+_lookup_drop = re.compile(f"[{re.escape(string.punctuation + ' ')}]+")
+
+
+# the key the lookups are made by: without spaces and punctuation, lower case
+def normalise_lookup(text):
+    return _lookup_drop.sub('', text).lower()
+
+
+# normalise_lookup of every text, in one pass over all of them joined
+def normalise_lookups(texts):
+    keys = _lookup_drop.sub('', '\0'.join(texts)).lower().split('\0')
+    if len(keys) != len(texts):
+        # a text with \0 in it, should not happen
+        return [normalise_lookup(text) for text in texts]
+    return keys
 
 
 class Entry:
@@ -1130,6 +1816,36 @@ class Entry:
         self.page_no = page_no
         self.entry_no = entry_no
         self.paragraph = paragraph
+        # normalised keys, computed once, see lookup and headword_lookup
+        self._lookup = None
+        self._headword_lookup = None
+
+    # headword and definition normalised, the lookup field of the exports
+    @property
+    def lookup(self):
+        if self._lookup is None:
+            self._lookup = normalise_lookup(self.headword + self.definition)
+        return self._lookup
+
+    # the headword normalised
+    @property
+    def headword_lookup(self):
+        if self._headword_lookup is None:
+            self._headword_lookup = normalise_lookup(self.headword)
+        return self._headword_lookup
+
+    # fills the keys of all the entries (of a page) at once
+    @staticmethod
+    def compute_lookups(entries):
+        keys = normalise_lookups([entry.headword + entry.definition for entry in entries] +
+                                 [entry.headword for entry in entries])
+        for entry, lookup, headword_lookup in zip(entries, keys, keys[len(entries):]):
+            entry._lookup = lookup
+            entry._headword_lookup = headword_lookup
+
+    def append_definition(self, definition):
+        self.definition += definition
+        self._lookup = None
 
     def __str__(self):
         return f'/{self.headword}/({self.page_no})\n{self.definition}'
@@ -1163,9 +1879,325 @@ class Entry:
         return s[2:-1]
 
 
+# pages are converted in shards of this size when PdfDecoderForFile runs with several workers
+PAGES_PER_SHARD = 8
+
+
+# entries per executemany in export_sqlite
+SQLITE_BATCH_SIZE = 1000
+
+# entries per insert_many in export_mongodb
+MONGODB_BATCH_SIZE = 1000
+# schema of the entries collection
+MONGODB_VALIDATOR = {
+    '$jsonSchema': {
+        'bsonType': 'object',
+        'required': ['headword', 'definition', 'page', 'lookup'],
+        'properties': {
+            'headword': {
+                'bsonType': 'string',
+                'description': 'must be a string and is required'
+            },
+            'definition': {
+                'bsonType': 'string',
+                'description': 'must be a string and is required'
+            },
+            'page': {
+                'bsonType': 'string',
+                'description': 'must be a int and is required'
+            },
+            'lookup': {
+                'bsonType': 'string',
+                'description': 'must be a string and is required'
+            }
+        }
+    }
+}
+
+# entries per multi-path update, concurrent updates and retries of a failed update in export_firebase
+FIREBASE_BATCH_SIZE = 500
+FIREBASE_WORKERS = 8
+FIREBASE_RETRIES = 5
+# the access token of export_firebase_async is renewed this long before it expires
+FIREBASE_TOKEN_MARGIN = timedelta(minutes=5)
+# TODO: should be picked up from json?
+FIREBASE_DATABASE_URL = 'https://matica-srpska-sy4-default-rtdb.europe-west1.firebasedatabase.app'
+
+# concurrent writer coroutines of AsyncExportEngine
+ASYNC_WRITERS = 8
+
+# columns of the positions file (name, array typecode, numpy dtype), see PdfDecoderForFile.write_positions
+POSITIONS_COLUMNS = (
+    ('page', 'H', '<u2'),
+    ('font', 'H', '<u2'),
+    ('x', 'f', '<f4'),
+    ('y', 'f', '<f4'),
+    ('dx', 'f', '<f4'),
+    ('dy', 'f', '<f4'),
+)
+POSITIONS_VERSION = 1
+
+# format of the state file of PdfDecoderForFile.convert_incremental, a state of another version is not used
+INCREMENTAL_STATE_VERSION = 1
+
+
+# lists of up to size items of iterable, pulled lazily
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+
+class AsyncExportEngine:
+    """
+    Uploads the entries while they are being decoded. The decoding runs in a thread and puts the records,
+    batch_size at a time, into a bounded queue; `writers` coroutines take the batches and await write(records).
+    The decoding and the upload overlap, so the wall time approaches the longer of them instead of their sum,
+    and the decoding waits while the queue is full.
+    records(entries) turns a batch of entries into the argument of write, it runs in the decoding thread.
+    """
+
+    def __init__(self, entries, records, write, batch_size, writers=ASYNC_WRITERS):
+        self.entries = entries
+        self.records = records
+        self.write = write
+        self.batch_size = batch_size
+        self.writers = writers
+        self.exported = 0
+        self.errors = []
+        # set by a failed write, the decoding stops at the next batch
+        self.failed = Event()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=2 * self.writers)
+        decoding = loop.run_in_executor(None, self._decode, loop, queue)
+        await asyncio.gather(decoding, *(self._writer(queue) for _ in range(self.writers)))
+        if len(self.errors) > 0:
+            raise self.errors[0]
+        return self.exported
+
+    def _decode(self, loop, queue):
+        try:
+            for batch in _batches(self.entries, self.batch_size):
+                if self.failed.is_set():
+                    break
+                asyncio.run_coroutine_threadsafe(queue.put((len(batch), self.records(batch))), loop).result()
+        finally:
+            for _ in range(self.writers):
+                asyncio.run_coroutine_threadsafe(queue.put(None), loop).result()
+
+    async def _writer(self, queue):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            # after a failure the queue is still drained, otherwise the decoding would wait forever
+            if len(self.errors) > 0:
+                continue
+            count, records = item
+            try:
+                await self.write(records)
+                self.exported += count
+            except Exception as e:
+                self.errors.append(e)
+                self.failed.set()
+
+
+# The settings of the run the workers need: a worker started by spawn or forkserver imports the module anew
+# and would see the defaults instead of what the command line has set
+def _worker_settings():
+    return {
+        'fixes': fixes,
+        'typos': typos,
+        'glitches': glitches,
+        'layout_engine': layout_engine,
+        'indent_detector_mode': indent_detector_mode,
+        'chunks_cache': chunks_cache,
+    }
+
+
+# ProcessPoolExecutor initializer, takes _worker_settings() of the parent
+def _init_worker(settings):
+    global fixes, typos, glitches, layout_engine, indent_detector_mode, chunks_cache
+    fixes = settings['fixes']
+    typos = settings['typos']
+    glitches = settings['glitches']
+    layout_engine = settings['layout_engine']
+    indent_detector_mode = settings['indent_detector_mode']
+    chunks_cache = settings['chunks_cache']
+    # the fonts are parsed once per worker, not once per shard
+    _worker_font_decoders.clear()
+
+
+# FontDecodersCache of a worker process kept across its shards, keyed by the file as objgen is per file
+_worker_font_decoders = {}
+
+
+# process pool entry point, must be a module level function to be picklable
+def _convert_pages_to_entries(pdf_file, page_numbers, counting=False):
+    # a worker counts its own shard, the counts are added up by the parent
+    global counters
+    counters = Counters() if counting else None
+    pages = []
+    font_decoders = _worker_font_decoders.setdefault(pdf_file, FontDecodersCache())
+    hits, misses = font_decoders.hits, font_decoders.misses
+    with pikepdf.open(pdf_file) as pdf:
+        for n in page_numbers:
+            decoder = PdfDecoderForPage(pdf.pages[n], n, fixes, typos, font_decoders)
+            pages.append((n, decoder.convert_to_entries([]), decoder.used_cids(), decoder.timings))
+    return (pages, font_decoders.hits - hits, font_decoders.misses - misses,
+            None if counters is None else counters.values)
+
+
+class JsonStreamWriter:
+    """
+    Writes the records one by one as the {key: record} object with sequential keys.
+    The text is the same as json.dump(..., indent=2, ensure_ascii=False) of the whole dict would produce.
+    """
+
+    def __init__(self, out):
+        self.out = out
+        self.key = 0
+        self.out.write('{')
+
+    def write(self, record):
+        body = json.dumps(record, indent=2, ensure_ascii=False).replace('\n', '\n  ')
+        self.out.write(f'{"," if self.key > 0 else ""}\n  "{self.key}": {body}')
+        self.key += 1
+
+    def close(self):
+        self.out.write('\n}' if self.key > 0 else '}')
+
+
+class PrefixIndex:
+    """
+    The normalised headwords sorted along with the numbers of their entries, i.e. the keys of the JSON output
+    and of the RTDB entries. The headwords are front coded in blocks of BLOCK_SIZE: the first one of a block
+    is kept whole, the others as [length of the prefix shared with the previous one, the rest]. A prefix query
+    is a binary search over the first headwords of the blocks and a scan from the block found.
+    """
+    VERSION = 1
+    BLOCK_SIZE = 16
+
+    def __init__(self, heads, tails, entries):
+        self.heads = heads
+        self.tails = tails
+        self.entries = entries
+
+    # keys_entries are (normalised headword, entry number)
+    @staticmethod
+    def build(keys_entries):
+        heads = []
+        tails = []
+        entries = []
+        prev = ''
+        for i, (key, entry) in enumerate(sorted(keys_entries)):
+            if i % PrefixIndex.BLOCK_SIZE == 0:
+                heads.append(key)
+                tails.append([])
+            else:
+                shared = len(os.path.commonprefix([prev, key]))
+                tails[-1].append([shared, key[shared:]])
+            entries.append(entry)
+            prev = key
+        return PrefixIndex(heads, tails, entries)
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.VERSION, 'block_size': self.BLOCK_SIZE, 'heads': self.heads,
+                       'tails': self.tails, 'entries': self.entries}, f, ensure_ascii=False, separators=(',', ':'))
+
+    @staticmethod
+    def load(path):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data['version'] != PrefixIndex.VERSION or data['block_size'] != PrefixIndex.BLOCK_SIZE:
+            raise ValueError(f"Unsupported prefix index {path}: version {data['version']}, block {data['block_size']}")
+        return PrefixIndex(data['heads'], data['tails'], data['entries'])
+
+    # (key, entry number) of the keys in the block
+    def _block(self, block):
+        key = self.heads[block]
+        n = block * self.BLOCK_SIZE
+        yield key, self.entries[n]
+        for shared, rest in self.tails[block]:
+            key = key[:shared] + rest
+            n += 1
+            yield key, self.entries[n]
+
+    # up to limit (key, entry number) with the keys starting with the normalised prefix, in the key order
+    def lookup(self, prefix, limit=25):
+        found = []
+        # the last block starting before the prefix can hold its first matches
+        block = max(bisect.bisect_left(self.heads, prefix) - 1, 0)
+        while block < len(self.heads):
+            for key, entry in self._block(block):
+                if key.startswith(prefix):
+                    found.append((key, entry))
+                    if len(found) == limit:
+                        return found
+                elif key > prefix:
+                    return found
+            block += 1
+        return found
+
+
+class SqliteDictionary:
+    """
+    The dictionary as a SQLite file for the apps to bundle. headword_lookup is the headword normalised as
+    the lookup field and has a B-tree index for the prefix search, the definitions FTS5 table
+    indexes the headwords and the definitions for the full text search.
+    """
+    SCHEMA = """
+        CREATE TABLE entries (
+            id INTEGER PRIMARY KEY,
+            headword TEXT NOT NULL,
+            definition TEXT NOT NULL,
+            page INTEGER NOT NULL,
+            headword_lookup TEXT NOT NULL
+        );
+        CREATE VIRTUAL TABLE definitions USING fts5(headword, definition, content='entries', content_rowid='id');
+    """
+    INDEXES = (
+        "CREATE INDEX entries_headword_lookup ON entries (headword_lookup)",
+        "INSERT INTO definitions (definitions) VALUES ('rebuild')",
+        "INSERT INTO definitions (definitions) VALUES ('optimize')",
+    )
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+
+    def close(self):
+        self.connection.close()
+
+    # up to limit entries with the normalised headword starting with the normalised prefix
+    def prefix(self, prefix, limit=25):
+        return self.connection.execute(
+            "SELECT * FROM entries WHERE headword_lookup >= ? AND headword_lookup < ?"
+            " ORDER BY headword_lookup, id LIMIT ?", (prefix, prefix + chr(0x10ffff), limit)).fetchall()
+
+    # up to limit entries matching the FTS5 query, the best ranked first
+    def search(self, query, limit=25):
+        return self.connection.execute(
+            "SELECT entries.* FROM definitions JOIN entries ON entries.id = definitions.rowid"
+            " WHERE definitions MATCH ? ORDER BY rank LIMIT ?", (query, limit)).fetchall()
+
+
 class PdfDecoderForFile:
-    def __init__(self, pdf_file):
+    def __init__(self, pdf_file, workers=1):
         self.pdf_file = pdf_file
+        self.workers = workers
+        # hits and misses of the worker processes are added up here too
+        self.font_decoders = FontDecodersCache()
+        # seconds per stage over all the decoded pages
+        self.timings = {}
 
     def check_titles(self):
         with pikepdf.open(self.pdf_file) as pdf:
@@ -1180,426 +2212,699 @@ class PdfDecoderForFile:
 
     # from and to are page numbers inclusive..exclusive (as in range)
     def each(self, lmbda, f=16, t=1528):
+        for entry in self.iter_entries(f, t):
+            lmbda(entry)
+
+    # the final entries of the pages f..t in order, the continuations joined.
+    # pages is an optional sorted list of the page numbers to decode instead of the whole f..t range
+    # with lookups the normalised keys of the entries are computed in bulk page by page
+    def iter_entries(self, f=16, t=1528, pages=None, lookups=False):
+        page_entries = self._each_page_entries(f, t, pages)
+        if lookups:
+            page_entries = self._with_lookups(page_entries)
+        return self._stitch(page_entries)
+
+    # the continuation joined later resets the lookup of the entry it is appended to
+    @staticmethod
+    def _with_lookups(page_entries):
+        for page in page_entries:
+            Entry.compute_lookups(page[1])
+            yield page
+
+    # PdfDecoderForPage of the pages f..t in order, the PDF is open while the iteration goes on
+    def iter_pages(self, f=16, t=1528, pages=None):
         with pikepdf.open(self.pdf_file) as pdf:
-            prev_entries = []
-            for n, page in enumerate(pdf.pages):
-                if n < f:
-                    continue
-                if n > t:
-                    break
-                if False and page["/Resources"].get("/Font", None) is None:
-                    print(f"No fonts found in page resources for page: {n}", file=sys.stderr)
-                    continue
+            if pages is None:
+                pages = range(f, min(t, len(pdf.pages) - 1) + 1)
+            for n in pages:
+                yield PdfDecoderForPage(pdf.pages[n], n, fixes, typos, self.font_decoders)
+
+    # (page_no, ChunksPage) of the pages f..t in order
+    def iter_chunks_pages(self, f=16, t=1528, pages=None):
+        for decoder in self.iter_pages(f, t, pages):
+            yield decoder.page_no, decoder.convert_to_chunks_page()
+
+    # joins the continuations across the pages and yields the entries,
+    # a gap in the page numbers starts over as if it were the first page.
+    # The last entry of a page is held back until the next page is joined,
+    # because the first paragraph of the next page can be its continuation.
+    @staticmethod
+    def _stitch(page_entries):
+        prev_entries = []
+        prev_n = None
+        held = None
+        for n, entries, _, _ in page_entries:
+            if prev_n is not None and n != prev_n + 1:
+                prev_entries = []
+            prev_n = n
+            entries = PdfDecoderForPage.join_continuation(prev_entries, entries)
+            if held is not None:
+                yield held
+                held = None
+            prev_entries = entries
+            for entry in entries:
+                if entry.headword is None:
+                    raise ValueError(f"Entry without headword: {entry}")
+            for entry in entries[:-1]:
+                yield entry
+            if len(entries) > 0:
+                held = entries[-1]
+        if held is not None:
+            yield held
+
+    # yields (page_no, entries, used_cids, timings) in page order, the entries are not joined with the previous
+    # page yet. pages is an optional sorted list of the page numbers to decode instead of the whole f..t range
+    def _each_page_entries(self, f, t, pages=None):
+        if self.workers > 1:
+            if pages is None:
+                with pikepdf.open(self.pdf_file) as pdf:
+                    pages = list(range(f, min(t, len(pdf.pages) - 1) + 1))
+            yield from self._each_page_entries_parallel(pages)
+        else:
+            for decoder in self.iter_pages(f, t, pages):
+                n = decoder.page_no
                 if debug_progress:
                     print(f"Page: {n}", end=' ', file=sys.stderr)
-                decoder = PdfDecoderForPage(page, n, fixes, typos)
-                if debug_progress:
                     print(decoder.title(), file=sys.stderr)
 
-                entries = decoder.convert_to_entries(prev_entries)
-                prev_entries = entries
-                for entry in entries:
-                    if entry.headword is not None:
-                        lmbda(entry)
-                    else:
-                        raise ValueError(f"Entry without headword: {entry}")
+                entries = decoder.convert_to_entries([])
+                self._add_timings(n, decoder.timings)
+                used_cids = decoder.used_cids()
+                timings = decoder.timings
+                # the page and its pikepdf objects are released before the entries are consumed
+                del decoder
+                yield n, entries, used_cids, timings
+        if debug_progress:
+            print(self.font_decoders, file=sys.stderr)
+        if debug_timings:
+            self._print_timings()
+
+    # every shard is decoded in a separate process with its own pdf handle,
+    # executor.map returns the shards in the submission order, i.e. in page order
+    def _each_page_entries_parallel(self, pages):
+        shards = [pages[i:i + PAGES_PER_SHARD] for i in range(0, len(pages), PAGES_PER_SHARD)]
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(_worker_settings(),)) as executor:
+            for shard, hits, misses, counts in executor.map(_convert_pages_to_entries, [self.pdf_file] * len(shards),
+                                                            shards, [counters is not None] * len(shards)):
+                self.font_decoders.hits += hits
+                self.font_decoders.misses += misses
+                if counts is not None:
+                    counters.merge(counts)
+                for n, entries, used_cids, timings in shard:
+                    if debug_progress:
+                        print(f"Page: {n}", file=sys.stderr)
+                    self._add_timings(n, timings)
+                    yield n, entries, used_cids, timings
+
+    def _add_timings(self, n, timings):
+        for stage, seconds in timings.items():
+            self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+        if debug_timings:
+            print(f"Page {n}: " + ', '.join(f"{stage} {seconds * 1000:.1f} ms" for stage, seconds in timings.items()),
+                  file=sys.stderr)
+
+    def _print_timings(self):
+        total = sum(self.timings.values()) or 1
+        print("Total: " + ', '.join(f"{stage} {seconds:.2f} s ({seconds * 100 / total:.0f}%)"
+                                    for stage, seconds in self.timings.items()), file=sys.stderr)
+
+    # Writes page, font, x, y, dx and dy of every chunk shown in the pages into the binary file at path.
+    # The file is columnar: every column is `count` little-endian values, one column after another,
+    # so a column can be memory mapped without reading the others. dy is the distance down from the previous
+    # chunk of the page. The offsets, the types and the font names (the font column is an index into them)
+    # are written to path.json.
+    def write_positions(self, path, f=16, t=1528):
+        columns = {name: array(typecode) for name, typecode, _ in POSITIONS_COLUMNS}
+        fonts = {}
+        for decoder in self.iter_pages(f, t):
+            if debug_progress:
+                print(f"Page: {decoder.page_no}", file=sys.stderr)
+            prev_y = None
+            for _, font, x, y, dx in decoder.raw_chunks():
+                columns['page'].append(decoder.page_no)
+                columns['font'].append(fonts.setdefault(font, len(fonts)))
+                columns['x'].append(x)
+                columns['y'].append(y)
+                columns['dx'].append(dx)
+                columns['dy'].append(0 if prev_y is None else prev_y - y)
+                prev_y = y
+
+        layout = []
+        offset = 0
+        tmp = f"{path}.tmp"
+        with open(tmp, 'wb') as wf:
+            for name, _, dtype in POSITIONS_COLUMNS:
+                column = columns[name]
+                if sys.byteorder == 'big':
+                    column.byteswap()
+                column.tofile(wf)
+                layout.append({'name': name, 'dtype': dtype, 'offset': offset})
+                offset += len(column) * column.itemsize
+        os.replace(tmp, path)
+        with open(f"{path}.json", 'w', encoding='utf-8') as jf:
+            json.dump({'version': POSITIONS_VERSION, 'count': len(columns['page']), 'columns': layout,
+                       'fonts': list(fonts)}, jf, indent=2)
+
+    # fills RawChunksDatabase at path with the pages f..t and the mappings of their fonts
+    def write_raw_database(self, path, f=16, t=1528):
+        database = RawChunksDatabase(path)
+        database.clear()
+        mapped = set()
+        for decoder in self.iter_pages(f, t):
+            if debug_progress:
+                print(f"Page: {decoder.page_no}", file=sys.stderr)
+            chunks_page = decoder.convert_to_chunks_page()
+            database.add_page(decoder.page_no, chunks_page.title(), chunks_page.chunks_paragraphs,
+                              decoder.font_decoders, decoder.raw_chunks())
+            for font_decoder in decoder.font_decoders.values():
+                # the fonts as FontDecodersCache keys them, a direct font object belongs to its page only
+                objgen = font_decoder.font.objgen
+                key = (objgen if objgen != (0, 0) else decoder.page_no, font_decoder.name)
+                if key not in mapped:
+                    mapped.add(key)
+                    database.add_mappings(font_decoder)
+        database.close()
 
     def debug_entry(self, page_no, entry_no_or_headword):
-        def lmbd(entry):
-            if isinstance(entry_no_or_headword, int):
-                if entry.entry_no == entry_no_or_headword:
-                    entry.debug()
-            elif isinstance(entry_no_or_headword, str):
-                if entry.headword == entry_no_or_headword:
-                    entry.debug()
-            else:
-                raise ValueError(f"Unexpected type: {type(entry_no_or_headword)}")
+        self.debug_entries([(page_no, entry_no_or_headword)])
 
-        self.each(lmbd, page_no, page_no)
-
-    _lookup_translator = str.maketrans('', '', string.punctuation)
+    # prints the entries given by (page_no, entry_no or headword). The PDF is opened once and every page is decoded
+    # once, only the pages with the entries asked for and their neighbours holding the continuations are decoded.
+    # The neighbours are taken from the dictionary pages f..t only.
+    def debug_entries(self, specs, f=16, t=1528):
+        decoded = {}
+        with pikepdf.open(self.pdf_file) as pdf:
+            # entries of the page, not joined with the neighbours
+            def page_entries(n):
+                if n not in decoded:
+                    decoder = PdfDecoderForPage(pdf.pages[n], n, fixes, typos, self.font_decoders)
+                    decoded[n] = decoder.convert_to_entries([])
+                return decoded[n]
+
+            for page_no, entry_no_or_headword in specs:
+                entries = page_entries(page_no)
+                for i, entry in enumerate(entries):
+                    if isinstance(entry_no_or_headword, int):
+                        found = entry.entry_no == entry_no_or_headword
+                    elif isinstance(entry_no_or_headword, str):
+                        found = entry.headword == entry_no_or_headword
+                    else:
+                        raise ValueError(f"Unexpected type: {type(entry_no_or_headword)}")
+                    if not found:
+                        continue
+                    # a continuation is shown as a part of the entry it continues on the previous page
+                    src_page, src_entries, src_i, src_entry = page_no, entries, i, entry
+                    if i == 0 and not entry.headword and page_no - 1 >= f and len(page_entries(page_no - 1)) > 0:
+                        src_page, src_entries = page_no - 1, page_entries(page_no - 1)
+                        src_i, src_entry = len(src_entries) - 1, src_entries[-1]
+                    definition = src_entry.definition
+                    if src_i == len(src_entries) - 1 and src_page + 1 <= min(t, len(pdf.pages) - 1):
+                        next_entries = page_entries(src_page + 1)
+                        if len(next_entries) > 0 and not next_entries[0].headword:
+                            definition += next_entries[0].definition
+                    Entry(src_entry.headword, definition, src_entry.page_no, src_entry.entry_no,
+                          src_entry.paragraph).debug()
 
     @staticmethod
     def lookup_translator(s):
-        return s.replace(' ', '').translate(PdfDecoderForFile._lookup_translator).lower()
+        return normalise_lookup(s)
 
     def print_txt(self, f=16, t=1528):
-        def lmbda(entry):
-            txt = entry.txt()
-            print(txt)
+        for entry in self.iter_entries(f, t):
+            print(entry.txt())
 
-        self.each(lmbda, f, t)
+    @staticmethod
+    def _csv_header(lookup):
+        if lookup:
+            return "headword\tdefinition\tpage\tpara\tlookup"
+        return "headword\tdefinition\tpage\tpara"
 
-    def print_csv(self, f=16, t=1528, lookup=False):
-        def lmbda(entry):
-            txt = entry.txt('\t')
-            if lookup:
-                txt += f"\t{self.lookup_translator(entry.headword + entry.definition)}"
-            print(txt)
+    @staticmethod
+    def _csv_record(entry, lookup):
+        txt = entry.txt('\t')
+        if lookup:
+            txt += f"\t{entry.lookup}"
+        return txt
 
+    @staticmethod
+    def _json_record(entry, lookup):
         if lookup:
-            print("headword\tdefinition\tpage\tpara\tlookup")
+            return {
+                "headword": entry.headword,
+                "definition": entry.definition,
+                "page": entry.page_no,
+                'lookup': entry.lookup
+            }
+        return {
+            "headword": entry.headword,
+            "definition": entry.definition,
+            "page": entry.page_no,
+        }
+
+    def print_csv(self, f=16, t=1528, lookup=False):
+        print(self._csv_header(lookup))
+        for entry in self.iter_entries(f, t, lookups=lookup):
+            print(self._csv_record(entry, lookup))
+
+    # entries are written as soon as they are final, the output is the same as of json.dump(..., indent=2)
+    # prefix_index is the path to save PrefixIndex of the headwords of the entries to
+    def print_json(self, f=16, t=1528, lookup=False, prefix_index=None):
+        writer = JsonStreamWriter(sys.stdout)
+        keys_entries = []
+        for entry in self.iter_entries(f, t, lookups=lookup or bool(prefix_index)):
+            if prefix_index:
+                keys_entries.append((entry.headword_lookup, writer.key))
+            writer.write(self._json_record(entry, lookup))
+        writer.close()
+        if prefix_index:
+            PrefixIndex.build(keys_entries).save(prefix_index)
+
+    # one json record per line
+    def print_ndjson(self, f=16, t=1528, lookup=False):
+        for entry in self.iter_entries(f, t, lookups=lookup):
+            print(json.dumps(self._json_record(entry, lookup), ensure_ascii=False))
+
+    # Writes the entries into a new SQLite file at path (see SqliteDictionary) in one transaction,
+    # the rows are inserted by batch_size, the indexes are built after the load
+    def export_sqlite(self, path, f=16, t=1528, batch_size=SQLITE_BATCH_SIZE):
+        tmp = f"{path}.tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        connection = sqlite3.connect(tmp)
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.executescript(SqliteDictionary.SCHEMA)
+
+        count = 0
+        with connection:
+            for batch in _batches(self.iter_entries(f, t, lookups=True), batch_size):
+                connection.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?)",
+                                       [(count + i, entry.headword, entry.definition, entry.page_no,
+                                         entry.headword_lookup) for i, entry in enumerate(batch)])
+                count += len(batch)
+            for statement in SqliteDictionary.INDEXES:
+                connection.execute(statement)
+        connection.execute("VACUUM")
+        connection.close()
+        os.replace(tmp, path)
+        return count
+
+    # Converts into the file at path (json or csv) and keeps next to it a state file with the fixups tables
+    # and the (font, cid) pairs used by every page. The next run re-decodes only the pages using the cids
+    # whose fixups or typos have changed since and patches their entries in the existing output.
+    def convert_incremental(self, path, fmt='json', lookup=False, f=16, t=1528):
+        state_path = f"{path}.state"
+        state = None
+        if os.path.exists(path) and os.path.exists(state_path):
+            with open(state_path, encoding='utf-8') as sf:
+                state = json.load(sf)
+        tables = _fixup_tables_state()
+        # the glitches change the layout of any page, so a changed table converts everything again
+        if state is None or state.get('version') != INCREMENTAL_STATE_VERSION or (
+                state['format'], state['lookup'], state['from'], state['to'], state['pdf'], state.get('glitches')) != (
+                fmt, lookup, f, t, self._pdf_signature(), glitches.state()):
+            targets = None
+            records = {}
+            used = {}
         else:
-            print("headword\tdefinition\tpage\tpara")
-        self.each(lmbda, f, t)
-
-    def print_json(self, f=16, t=1528, lookup=False):
-        json_key = 0
-        j = {}
-
-        def process_entries_json(entry):
-            nonlocal json_key
-            if lookup:
-                j[json_key] = {
-                    "headword": entry.headword,
-                    "definition": entry.definition,
-                    "page": entry.page_no,
-                    'lookup': self.lookup_translator(entry.headword + entry.definition)
-                }
+            targets = self._affected_pages(state, tables)
+            records = self._read_records(path, fmt)
+            used = {int(n): cids for n, cids in state['pages'].items()}
+            if debug_progress:
+                print(f"Pages to update: {targets}", file=sys.stderr)
+            if len(targets) == 0:
+                return
+
+        # the last entry of the previous page gets the continuation from the target page, so that page is
+        # re-emitted too. The pages around the re-emitted ones are decoded only to join the continuations, their
+        # records are kept: n - 2 takes the continuation the re-emitted page n - 1 starts with, which would be
+        # emitted as an entry of its own otherwise, and n + 1 gives the continuation of the last entry of page n
+        pages = None
+        if targets is not None:
+            last = max(used)
+            previous = {n - 1 for n in targets if n - 1 >= f}
+            before_previous = {n - 2 for n in targets if n - 2 >= f}
+            following = {n + 1 for n in targets if n + 1 <= last}
+            pages = sorted(targets | previous | before_previous | following)
+            targets = targets | previous
+            for n in targets:
+                records[n] = []
+
+        def page_entries():
+            for n, entries, used_cids, timings in self._each_page_entries(f, t, pages):
+                used[n] = {font: sorted(cids) for font, cids in used_cids.items()}
+                yield n, entries, used_cids, timings
+
+        pages_entries = page_entries()
+        if lookup:
+            pages_entries = self._with_lookups(pages_entries)
+        for entry in self._stitch(pages_entries):
+            if targets is None or entry.page_no in targets:
+                record = self._json_record(entry, lookup) if fmt == 'json' else self._csv_record(entry, lookup)
+                records.setdefault(entry.page_no, []).append(record)
+
+        self._write_records(path, fmt, lookup, [r for n in sorted(records) for r in records[n]])
+        state = {'version': INCREMENTAL_STATE_VERSION, 'format': fmt, 'lookup': lookup, 'from': f, 'to': t,
+                 'pdf': self._pdf_signature(), 'glitches': glitches.state(), 'fixes': tables['fixes'],
+                 'typos': tables['typos'],
+                 'pages': {str(n): used[n] for n in sorted(used)}}
+        with open(state_path, 'w', encoding='utf-8') as sf:
+            json.dump(state, sf, ensure_ascii=False)
+
+    def _pdf_signature(self):
+        stat = os.stat(self.pdf_file)
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    @staticmethod
+    def _affected_pages(state, tables):
+        changed_cids = {}
+        for font in set(state['fixes']) | set(tables['fixes']):
+            old = state['fixes'].get(font, {})
+            new = tables['fixes'].get(font, {})
+            cids = {int(cid) for cid in set(old) | set(new) if old.get(cid) != new.get(cid)}
+            if len(cids) > 0:
+                changed_cids[font] = cids
+        # typos are keyed by the whole text of a chunk, so any change invalidates all the pages with that font
+        changed_fonts = {font for font in set(state['typos']) | set(tables['typos'])
+                         if state['typos'].get(font) != tables['typos'].get(font)}
+
+        affected = set()
+        for n, used in state['pages'].items():
+            for font, cids in used.items():
+                if font in changed_fonts or not changed_cids.get(font, set()).isdisjoint(cids):
+                    affected.add(int(n))
+                    break
+        return affected
+
+    @staticmethod
+    def _read_records(path, fmt):
+        records = {}
+        with open(path, encoding='utf-8') as rf:
+            if fmt == 'json':
+                for record in json.load(rf).values():
+                    records.setdefault(record['page'], []).append(record)
             else:
-                j[json_key] = {
-                    "headword": entry.headword,
-                    "definition": entry.definition,
-                    "page": entry.page_no,
-                }
-            json_key += 1
+                next(rf)  # header
+                for line in rf:
+                    line = line.rstrip('\n')
+                    records.setdefault(int(line.split('\t')[2]), []).append(line)
+        return records
+
+    def _write_records(self, path, fmt, lookup, records):
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as wf:
+            if fmt == 'json':
+                writer = JsonStreamWriter(wf)
+                for record in records:
+                    writer.write(record)
+                writer.close()
+            else:
+                print(self._csv_header(lookup), file=wf)
+                for record in records:
+                    print(record, file=wf)
+        os.replace(tmp, path)
 
-        self.each(process_entries_json, f, t)
-        json.dump(j, sys.stdout, indent=2, ensure_ascii=False)
+    # The entries are inserted by unordered insert_many of batch_size entries, the indexes are built after the load.
+    # lookup is indexed for the anchored prefix regex of the app, headword for the exact matches.
+    def export_mongodb(self, connection_string, f=16, t=1528, batch_size=MONGODB_BATCH_SIZE, database='matica'):
+        from pymongo import ASCENDING, MongoClient
 
-    def export_mongodb(self, connection_string, f=16, t=1528):
-        raise NotImplementedError("MongoDB export is not implemented lookup feature yet")
         client = MongoClient(connection_string)
-        db = client.matica
-        collection = db.entries
-        collection.drop()
-        collection = db.create_collection(
-            'entries',
-            validator={
-                '$jsonSchema': {
-                    'bsonType': 'object',
-                    'required': ['headword', 'definition', 'page'],
-                    'properties': {
-                        'headword': {
-                            'bsonType': 'string',
-                            'description': 'must be a string and is required'
-                        },
-                        'definition': {
-                            'bsonType': 'string',
-                            'description': 'must be a string and is required'
-                        },
-                        'page': {
-                            'bsonType': 'string',
-                            'description': 'must be a int and is required'
-                        }
-                    }
-                }
-            }
-        )
-
-        def process_entries_mongodb(entry):
-            # Insert into MongoDB collection
-            collection.insert_one({
+        db = client[database]
+        db.drop_collection('entries')
+        collection = db.create_collection('entries', validator=MONGODB_VALIDATOR)
+
+        count = 0
+        start = time.perf_counter()
+        for batch in _batches(self.iter_entries(f, t, lookups=True), batch_size):
+            collection.insert_many([{
                 'headword': entry.headword,
                 'definition': entry.definition,
-                'page': str(entry.page_no)  # Ensure page_no is converted to a string
-            })
-
-        self.each(process_entries_mongodb, f, t)
+                'page': str(entry.page_no),  # Ensure page_no is converted to a string
+                'lookup': entry.lookup
+            } for entry in batch], ordered=False)
+            count += len(batch)
+        loaded = time.perf_counter()
+
+        collection.create_index([('lookup', ASCENDING)])
+        collection.create_index([('headword', ASCENDING)])
+        client.close()
+
+        elapsed = time.perf_counter() - start
+        print(f"Exported {count} entries in {elapsed:.1f} s, {count / elapsed:.0f} entries/s "
+              f"(batch {batch_size}, indexes {time.perf_counter() - loaded:.1f} s)", file=sys.stderr)
+        return count
+
+    # The same as export_mongodb, the batches are inserted by AsyncExportEngine with the asynchronous
+    # client of pymongo while the pages are being decoded
+    def export_mongodb_async(self, connection_string, f=16, t=1528, batch_size=MONGODB_BATCH_SIZE,
+                             writers=ASYNC_WRITERS, database='matica'):
+        from pymongo import ASCENDING, AsyncMongoClient
+
+        def records(entries):
+            return [{
+                'headword': entry.headword,
+                'definition': entry.definition,
+                'page': str(entry.page_no),  # Ensure page_no is converted to a string
+                'lookup': entry.lookup
+            } for entry in entries]
 
-    def export_firebase(self, connection_string, f=16, t=1528):
+        async def export():
+            client = AsyncMongoClient(connection_string)
+            try:
+                db = client[database]
+                await db.drop_collection('entries')
+                collection = await db.create_collection('entries', validator=MONGODB_VALIDATOR)
+
+                async def write(documents):
+                    await collection.insert_many(documents, ordered=False)
+
+                exported = await AsyncExportEngine(self.iter_entries(f, t, lookups=True), records, write, batch_size,
+                                                   writers).run()
+                await collection.create_index([('lookup', ASCENDING)])
+                await collection.create_index([('headword', ASCENDING)])
+                return exported
+            finally:
+                await client.close()
+
+        start = time.perf_counter()
+        exported = asyncio.run(export())
+        elapsed = time.perf_counter() - start
+        print(f"Exported {exported} entries in {elapsed:.1f} s, {exported / elapsed:.0f} entries/s "
+              f"(batch {batch_size}, writers {writers})", file=sys.stderr)
+        return exported
+
+    # The entries are written by multi-path updates of batch_size entries, up to `workers` updates are in flight.
+    # connection_string is the service account key json, it can be None for the emulator
+    # (FIREBASE_DATABASE_EMULATOR_HOST=host:port).
+    def export_firebase(self, connection_string, f=16, t=1528, batch_size=FIREBASE_BATCH_SIZE,
+                        workers=FIREBASE_WORKERS):
+        import firebase_admin
         from firebase_admin import credentials
         from firebase_admin import db
 
-        credentials = credentials.Certificate(connection_string)
+        credentials = credentials.Certificate(connection_string) if connection_string else None
         firebase_admin.initialize_app(credentials, {
-            # TODO: should be picked up from json?
-            'databaseURL': 'https://matica-srpska-sy4-default-rtdb.europe-west1.firebasedatabase.app'
+            'databaseURL': FIREBASE_DATABASE_URL
         })
 
         entries_ref = db.reference('entries')
         # search by headword is not good idea, because they are not unique
         entries_ref.delete()
 
+        key = 0
+        pending = set()
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for batch in _batches(self.iter_entries(f, t, lookups=True), batch_size):
+                # backpressure: the decoding waits while all the workers are busy
+                if len(pending) >= workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                update = {}
+                for entry in batch:
+                    update[str(key)] = {
+                        'headword': entry.headword,
+                        'definition': entry.definition,
+                        'page': entry.page_no,
+                        'lookup': entry.lookup
+                    }
+                    key += 1
+                pending.add(executor.submit(self._firebase_update, entries_ref, update))
+            for future in pending:
+                future.result()
+
+        elapsed = time.perf_counter() - start
+        print(f"Exported {key} entries in {elapsed:.1f} s, {key / elapsed:.0f} entries/s "
+              f"(batch {batch_size}, workers {workers})", file=sys.stderr)
+        return key
+
+    # The same as export_firebase, the multi-path updates are sent by AsyncExportEngine through the REST API
+    # while the pages are being decoded
+    def export_firebase_async(self, connection_string, f=16, t=1528, batch_size=FIREBASE_BATCH_SIZE,
+                              writers=ASYNC_WRITERS, database_url=FIREBASE_DATABASE_URL):
+        import httpx
+
+        emulator_host = os.environ.get('FIREBASE_DATABASE_EMULATOR_HOST')
+        credential = None
+        if emulator_host:
+            base_url = f"http://{emulator_host}"
+            params = {'ns': database_url.split('://')[1].split('.')[0]}
+        else:
+            from firebase_admin import credentials
+
+            base_url = database_url
+            params = {}
+            credential = credentials.Certificate(connection_string)
+        # AccessTokenInfo of the credential, fetched again shortly before it expires or after a 401
+        token = None
+
+        async def auth(token_lock, stale=None):
+            nonlocal token
+            if credential is None:
+                return params, None
+            async with token_lock:
+                now = datetime.now(timezone.utc).replace(tzinfo=None)
+                if token is None or token is stale or (
+                        token.expiry is not None and token.expiry - now < FIREBASE_TOKEN_MARGIN):
+                    # get_access_token is a blocking request to the token endpoint
+                    token = await asyncio.to_thread(credential.get_access_token)
+                return {'access_token': token.access_token}, token
+
         key = 0
 
-        def process_entries_rtdb(entry):
-            # start_time = time.time()
-            # snapshot = entries_ref.order_by_child('headword').equal_to(entry.headword).get()
-            # end_time = time.time()
-            # execution_time = end_time - start_time
-            # print(f"Execution time equal_to({entry.headword}): {execution_time} seconds")
-            # entries = list(snapshot.items())
-            # if len(entries) > 0:
-            #    print(f"Duplicate headword: {entry.headword}")
-            # key, _ = entries[0]
-            # start_time = time.time()
+        def records(entries):
             nonlocal key
-            ref = entries_ref.child(str(key))
-            # else:
-            # ref = entries_ref.push()
-            ref.set(
-                {'headword': entry.headword,
-                 'definition': entry.definition,
-                 'page': entry.page_no,
-                 'lookup': self.lookup_translator(entry.headword + entry.definition)
-                 })
-
-            key += 1
-            # end_time = time.time()
-            # execution_time = end_time - start_time
-            # print(f"Execution time ref.set ({entry.headword}): {execution_time} seconds")
-
-        self.each(process_entries_rtdb, f, t)
-
-
-def bytes2cid(b):
-    return b[0] << 8 | b[1]
-
-
-fixes = {
-    '/C0_0': {
-        bytes2cid(b'\x00b'): '~',
-        bytes2cid(b'\x00['): 'а',
-        bytes2cid(b'\x00e'): '~',
-        # bytes2cid(b'\x00\x0b'): '~', breaks p23. ајурведски -а, -о који се односи на ајурведу: медицина.
-        bytes2cid(b'\x00\r'): '~',
-        # bytes2cid(b'\x00\x0b'): '~', ^26:27 2[-зма >-з~а ]
-        # bytes2cid(b'\x00\x0b'): '~', ^18:6 политички~
-        bytes2cid(b'\x00\x13'): '~',
-        bytes2cid(b'\x00\xb8'): 'и',
-        bytes2cid(b'\x00\xd0'): 'и',
-        bytes2cid(b'\x01\xb5'): 'л',
-    },
-    '/C0_1': {
-        # bytes2cid(b'\x00"'): 'ш',
-        # bytes2cid(b'\x00"'): 'а', # 16:7 аБДИRација >абдикација - not needed
-        # bytes2cid(b'\x00"'): 'ш', # 17:14 ^[дошао. >доаао. ] - not needed
-        bytes2cid(b'\x00|'): 'с',
-        # bytes2cid(b'\x08<'): 'к',!!!
-        bytes2cid(b'\x00f'): 'и',
-        bytes2cid(b'\x00h'): 'к',
-        bytes2cid(b'\x00r'): 'к',
-        # bytes2cid(b'\x00t'): 'е', # 17:14 [речце: >речцее ],
-        # bytes2cid(b'\x00\x0c'): 'д', # ^16:32 абонос > абондс
-        bytes2cid(b'\x00\x13'): '~',
-        bytes2cid(b'\x00\x14'): '~',
-        bytes2cid(b'\x00\x7f'): 'д',
-        bytes2cid(b'\x00\x83'): 'н',
-        bytes2cid(b'\x00\x8f'): 'и',
-        bytes2cid(b'\x00\x95'): 'о',
-        bytes2cid(b'\x00\x9e'): 'т',
-        bytes2cid(b'\x00\xa2'): '~',
-        bytes2cid(b'\x00\xa7'): 'а',
-        bytes2cid(b'\x00\xac'): 'л',
-        bytes2cid(b'\x00\xb9'): 'д',
-        bytes2cid(b'\x00\xbd'): 'и',
-        bytes2cid(b'\x00\xd5'): 'и',
-        bytes2cid(b'\x00\xfa'): 'ч',
-        bytes2cid(b'\x01j'): 'ц',
-        bytes2cid(b'\x01\x02'): 'у',
-        bytes2cid(b'\x01\x07'): 'б',
-        bytes2cid(b'\x01\xd6'): 'о',
-        bytes2cid(b'\x02+'): 'и',
-        bytes2cid(b'\x02\xa8'): 'лингв',
-        bytes2cid(b'\x02\x9f'): 'к',
-        bytes2cid(b'\x03\x86'): '.',
-        bytes2cid(b'\x03\x1a'): '',
-        bytes2cid(b'\x04l'): 'д',
-        bytes2cid(b'\x04\x16'): 'и',
-        bytes2cid(b'\x04\x85'): 'и',
-        bytes2cid(b'\x04\xbe'): 'ак',
-        bytes2cid(b'\x04\xbf'): 'и',
-
-        # bytes2cid(b'\x01\xff'): '@1',
-        # bytes2cid(b'\x00\x07'): '@3',
-        # bytes2cid(b'\x00\x07'): '@3',
-    },
-    '/C0_2': {
-        bytes2cid(b'\x00|'): 'с',
-        bytes2cid(b'\x00.'): 'мн',
-        bytes2cid(b'\x00F'): 'е',
-        bytes2cid(b'\x01Z'): 'и',
-        bytes2cid(b'\x00t'): 'е',
-        # bytes2cid(b'\x00\x01'): 'а', !16:7 ж >а
-        bytes2cid(b'\x00\x19'): 'ј',
-        bytes2cid(b'\x00\xa9'): 'р',
-        bytes2cid(b'\x00\xb3'): 'к',
-        bytes2cid(b'\x00\xbe'): 'в',
-        bytes2cid(b'\x01l'): 'д',
-        bytes2cid(b'\x01\x02'): 'у',
-        bytes2cid(b'\x06\xdb'): 'и',
-
-        # bytes2cid(b'\x00\x07'): '?',
-    },
-    '/C0_3': {
-        bytes2cid(b'\n%\x05'): 'њ',
-        bytes2cid(b'\n+'): 'о',
-        bytes2cid(b'\nP'): 'с',
-        bytes2cid(b'\no'): 'у',
-        bytes2cid(b'\rh'): 'п',
-        bytes2cid(b'\n\x14'): 'н',
-        bytes2cid(b'\n\xa4'): 'т',
-        bytes2cid(b'\n\xcb'): 'а',
-        bytes2cid(b'\n\xe4'): 'п',
-        bytes2cid(b'\t\xd7'): 'п',
-        bytes2cid(b'\x000'): 'п',
-        bytes2cid(b'\x06<'): 'ћ',
-        # bytes2cid(b'\x08^'): 'лингв', broken
-        bytes2cid(b'\x08]'): 'п',
-        # bytes2cid(b'\x00\r'):
-        bytes2cid(b'\x00\t'): 'с',  # 16:9 [евр. >свр. ]
-        # bytes2cid(b'\x00\t'): 'в, #p21 агресивност, -ости
-        bytes2cid(b'\x00V'): 'п',
-        bytes2cid(b'\x00\x08'): 'т',
-        bytes2cid(b'\x00\x0c'): 'д',
-        bytes2cid(b'\x00\xa3'): 'г',
-        # bytes2cid(b'\x00\x16'): 'т', # 'з', /адмирал/(21) ...  2. тоол. врста
-        bytes2cid(b'\x00\xff'): 'љ',
-        bytes2cid(b'\x01d'): '1',
-        bytes2cid(b'\x02\x13'): '',
-        bytes2cid(b'\x04l'): 'н',
-        bytes2cid(b'\x04U'): 'с',
-        bytes2cid(b'\x04\xa0'): 'м',
-        bytes2cid(b'\x04\xa4'): 'к',
-        bytes2cid(b'\x04\xb1'): 'м',
-        bytes2cid(b'\x04\xc0'): 'о',
-        bytes2cid(b'\x04\xe8'): 'п',
-        # bytes2cid(b'\x04\xe9'): 'у', # ^17:55 дрyгUЈИ дрyгуЈИ
-        bytes2cid(b'\x04\xe9'): 'и',  # 17:55 дрyгUЈИ дрyгиЈИ
-        bytes2cid(b'\x05m'): 'ал',
-        bytes2cid(b'\x05\x1e'): 'пл',  # 17:55 ваздуоповни
-        bytes2cid(b'\x06\x10'): 'д',
-        bytes2cid(b'\x08^'): 'и',  # p21, ајурведски ... односи,
-        bytes2cid(b'\x0b\xa8'): 'аљ',  # p21, ајурведски ... односи,
-        bytes2cid(b'\x0cP'): 'с',
-        # bytes2cid(b'\x0e\xc4'): '@1',
-        bytes2cid(b'\x0f-'): 'р',
-        # bytes2cid(b'\x0f\x83'): 'ј',
-        # bytes2cid(b'\x0c\xf4'): 'ни',
-        bytes2cid(b'\x10\xcf'): 'е',
-        bytes2cid(b'\x10\xd1'): 'т',
-        bytes2cid(b'\x12G'): 'в',
-    },
-    '/C0_4': {
-        bytes2cid(b'\n+'): 'о',
-        bytes2cid(b'\nP'): 'с',
-        bytes2cid(b'\no'): 'у',
-        bytes2cid(b'\n\x14'): 'н',
-        bytes2cid(b'\n\xa4'): 'т',
-        bytes2cid(b'\n\xb0'): 'и',
-        bytes2cid(b'\rh'): 'п',
-        bytes2cid(b'\r\x92'): 'т',
-        bytes2cid(b'\r\xa2'): 'тл',
-        bytes2cid(b'\t\x88'): 'љ',
-        bytes2cid(b'\t\xc4'): 'ж',
-        bytes2cid(b'\t\xd7'): 'п',
-        bytes2cid(b'\t\xef'): 'к',
-        bytes2cid(b'\t\xf8'): 'л',
-        bytes2cid(b'\x00;'): 'г',
-        bytes2cid(b'\x00:'): 'г',
-        bytes2cid(b'\x00x'): 'н',
-        bytes2cid(b'\x00y'): '~',
-        bytes2cid(b'\x00\t'): 'с',
-        # bytes2cid(b'\x00\x12'): '~', ^17:8 [геол. >ге~л. ]
-        bytes2cid(b'\x00\x17'): 'г',
-        bytes2cid(b'\x00\xd0'): 'гм',
-        bytes2cid(b'\x01_'): 'к',
-        bytes2cid(b'\x01,'): 'и',
-        bytes2cid(b'\x02&'): '.',
-        bytes2cid(b'\x02\xb8'): '',  # 16:9 [. > ]
-        bytes2cid(b'\x03O'): 'к',
-        bytes2cid(b'\x03)'): 'о',
-        bytes2cid(b'\x03\xc9'): 'д',
-        bytes2cid(b'\x04j'): 'н',
-        bytes2cid(b'\x04l'): 'н',
-        bytes2cid(b'\x04U'): 'с',
-        bytes2cid(b'\x04\xb1'): 'м',
-        bytes2cid(b'\x04\xe9'): 'и',
-        bytes2cid(b'\x04\xa4'): 'к',
-        bytes2cid(b'\x04\xc0'): 'о',
-        bytes2cid(b'\x05I'): 'а',
-        bytes2cid(b'\x05o'): 'ам',
-        bytes2cid(b'\x05\x0c'): 'иљ',
-        bytes2cid(b'\x05\xb7'): 'в',
-        bytes2cid(b'\x05\xf1'): 'гл',
-        bytes2cid(b'\x05\xee'): 'г',
-        bytes2cid(b'\x05\xeb'): 'г',
-        # bytes2cid(b'\x00\x01'): '', #p21 агресивност, -ости {ж}
-        bytes2cid(b'\x06<'): 'ћ',
-        bytes2cid(b'\x06L'): 'г',
-        bytes2cid(b'\x06\x10'): 'д',
-        bytes2cid(b'\x07?'): 'г',
-        bytes2cid(b'\x08^'): 'и',
-        bytes2cid(b'\x0c '): 'ил',
-        bytes2cid(b'\x0c\x9a'): 'ељ',
-        bytes2cid(b'\x0e\x1e'): 'пл',
-        bytes2cid(b'\x10\xd1'): 'т',
-    },
-    '/C0_5': {
-        bytes2cid(b'\nF'): 'р',
-        bytes2cid(b'\nP'): 'с',
-        bytes2cid(b'\n\xa4'): 'т',
-        bytes2cid(b'\t\x88'): 'љ',
-        bytes2cid(b'\t\xd7'): 'п',
-        bytes2cid(b'\x00y'): '~',
-        bytes2cid(b'\x00\x9e'): '~',
-
-        # bytes2cid(b'\n\x9e'): 'н', #useless
-        bytes2cid(b'\x03`'): 'н',
-        bytes2cid(b'\x004`'): 'г',
-        bytes2cid(b'\x10\xd1`'): 'т',
-        bytes2cid(b'\x03)'): 'о',
-        bytes2cid(b'\x03\xd1'): ':',
-
-        bytes2cid(b'\x08\xe6'): 'имљ',  # p20 /агресивност/(20)
-        # bytes2cid(b'\x0c\xf4'): 'и', #p20 /агресивност/(20)
-        # bytes2cid(b'\x0b\xe4'): 'љ',
-    },
-    '/C0_6': {
-        # bytes2cid(b'\x00\1b'): '~', ^18:6 [хем. >хем~ ]
-        bytes2cid(b'\x00\01'): '~',
-    },
-    '/C0_7': {
-        bytes2cid(b'\x00y'): '~',
-        bytes2cid(b'\x00\x0b'): '~',
-        bytes2cid(b'\x00\x07'): 'л',
-        bytes2cid(b'\x001'): 'с',
-    },
-    '/C0_8': {
-        bytes2cid(b'\x00.'): 'у',
-        bytes2cid(b'\x00\x04'): 'а',
-        bytes2cid(b'\x00\x14'): 'з',
-        bytes2cid(b'\x00\x1c'): 'в',
-        bytes2cid(b'\x02\xfa'): 'ш',
-    },
-    '/C0_9': {
-        bytes2cid(b'\x00\x8e'): '~',
-    },
-    '/C0_10': {
-        # bytes2cid(b'\x00\x04'): 'ц', #!!!!
-        # bytes2cid(b'\x00 '): '@1',
-        bytes2cid(b'\x00A'): 'и',
-        # bytes2cid(b'\x00\t'): 'ијс', # 16:8 (абдик3.цйјскЙ), >(абдикацски) ^16:1[данас? >данаијс? ],
-        bytes2cid(b'\x00\x04'): 'е',
-        bytes2cid(b'\x00\x13'): 'ј',  # 16:8 (абдик3.цйјскЙ), >(абдикацски)
-        # bytes2cid(b'\x00\x1c'): 'ј', # 16:8 (абдик3.цйјскЙ), >(абдикацски)
-        bytes2cid(b'\x00\x1c'): ',',
-        bytes2cid(b'\x01H'): 'р',
-        bytes2cid(b'\x01\x12'): 'и',
-        # bytes2cid(b'\x01\x12'): 'а',
-        bytes2cid(b'\x021'): 'е',
-        bytes2cid(b'\x02\xcc'): 'ациј',  # 16:8 (абдик3.цйјскЙ), >(абдикацски)
-        bytes2cid(b'\x03`'): 'д',
-
-        # bytes2cid(b'\x00O'): '@2', # 16:8 (абдик3.цйјскЙ), >(абдикацски)
+            update = {}
+            for entry in entries:
+                update[str(key)] = {
+                    'headword': entry.headword,
+                    'definition': entry.definition,
+                    'page': entry.page_no,
+                    'lookup': entry.lookup
+                }
+                key += 1
+            return update
+
+        async def export():
+            token_lock = asyncio.Lock()
+            async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+                async def write(update):
+                    stale = None
+                    for attempt in range(FIREBASE_RETRIES + 1):
+                        request_params, used = await auth(token_lock, stale)
+                        stale = None
+                        try:
+                            response = await client.patch('/entries.json', json=update, params=request_params)
+                            response.raise_for_status()
+                            return
+                        except httpx.HTTPError as e:
+                            if isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 401:
+                                # the token has been revoked or has expired earlier than announced
+                                stale = used
+                            if attempt == FIREBASE_RETRIES:
+                                raise
+                            delay = 0.5 * 2 ** attempt
+                            print(f"Firebase update of {len(update)} entries failed ({e}), retry in {delay} s",
+                                  file=sys.stderr)
+                            await asyncio.sleep(delay)
+
+                # search by headword is not good idea, because they are not unique
+                (await client.delete('/entries.json', params=(await auth(token_lock))[0])).raise_for_status()
+                engine = AsyncExportEngine(self.iter_entries(f, t, lookups=True), records, write, batch_size, writers)
+                return await engine.run()
+
+        start = time.perf_counter()
+        exported = asyncio.run(export())
+        elapsed = time.perf_counter() - start
+        print(f"Exported {exported} entries in {elapsed:.1f} s, {exported / elapsed:.0f} entries/s "
+              f"(batch {batch_size}, writers {writers})", file=sys.stderr)
+        return exported
+
+    # one multi-path update, retried with exponential backoff
+    @staticmethod
+    def _firebase_update(ref, batch, retries=FIREBASE_RETRIES):
+        from firebase_admin import exceptions
+
+        for attempt in range(retries + 1):
+            try:
+                ref.update(batch)
+                return
+            except exceptions.FirebaseError as e:
+                if attempt == retries:
+                    raise
+                delay = 0.5 * 2 ** attempt
+                print(f"Firebase update of {len(batch)} entries failed ({e}), retry in {delay} s", file=sys.stderr)
+                time.sleep(delay)
+
+
+# the fixups tables in the json form stored by the incremental conversion
+def _fixup_tables_state():
+    return {
+        'fixes': {font: {str(cid): text for cid, text in table.items()} for font, table in fixes.items()},
+        'typos': {font: dict(table) for font, table in typos.items()},
     }
-}
-typos = {
-    # '/C0_4': mongodb://localhost:27017/{
-    #    'cамoгаcник ': 'самогласник ',
-    # }
-}
+
+
+FIXUPS_FILE = os.path.join(os.path.dirname(__file__), 'fixups.json')
+FIXUPS_VERSION = 1
+
+
+# Reads the fixups file: {"version": 1, "fixes": {font: [entry, ...]}, "typos": {font: [entry, ...]}} where
+# an entry of fixes is {"cid": hex, "text": replacement} and of typos {"typo": text, "text": replacement},
+# both with optional "note" (the page:entry it was found on and why) and "disabled" (kept for the record).
+# Returns fixes {font: {cid: text}} and typos {font: {typo: text}} as PdfDecoderForPage takes them.
+def load_fixups(path):
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('version') != FIXUPS_VERSION:
+        raise ValueError(f"{path}: fixups version {data.get('version')}, expected {FIXUPS_VERSION}")
+    tables = {}
+    for section, key in (('fixes', 'cid'), ('typos', 'typo')):
+        tables[section] = {}
+        for font, entries in data.get(section, {}).items():
+            for entry in entries:
+                if entry.get('disabled', False):
+                    continue
+                table = tables[section].setdefault(font, {})
+                source = int(entry[key], 16) if key == 'cid' else entry[key]
+                if source in table:
+                    raise ValueError(f"{path}: {font} {key} {entry[key]} is fixed twice")
+                table[source] = entry['text']
+    return tables['fixes'], tables['typos']
+
+
+# (path, size, mtime) of the loaded fixups file
+_fixups_signature = None
+
+
+# Loads the fixups file into fixes and typos if it has changed since the last load; the dicts are updated in
+# place and the cached font decoders pick the change up (see FontDecodersCache), so a running converter
+# applies the new fixups to the pages decoded next. Returns True if the fixups differ from the loaded ones.
+def reload_fixups(path=FIXUPS_FILE):
+    global _fixups_signature
+    stat = os.stat(path)
+    signature = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if signature == _fixups_signature:
+        return False
+    # a file failing to load is not read again until it changes
+    _fixups_signature = signature
+    new_fixes, new_typos = load_fixups(path)
+    if (new_fixes, new_typos) == (fixes, typos):
+        return False
+    fixes.clear()
+    fixes.update(new_fixes)
+    typos.clear()
+    typos.update(new_typos)
+    return True
+
+
+fixes = {}
+typos = {}
+reload_fixups()
 
 
 class Th:
@@ -1609,12 +2914,11 @@ class Th:
         self.expected_body = expected_body
 
 
-def test_page_entries(page_no, expected_title, expected_entries, test_entries):
+def test_page_entries(page_no, expected_title, expected_entries, test_entries, pool=None):
     print("Testing entries, page", page_no)
-    with pikepdf.open(os.path.join(os.path.dirname(__file__), 'matica/matica-full.pdf')) as pdf:
-        page = pdf.pages[page_no]
+    with nullcontext(pool) if pool else TestPagesPool() as pool:
         # decoder = PdfDecoderForPage(page, page_no, fixes, typos)
-        decoder = PdfDecoderForPage(page, page_no)  # no fixes for easier comparision with PDF
+        decoder = pool.decoder(page_no)  # no fixes for easier comparision with PDF
         entries = decoder.convert_to_entries([])
 
         print("Expected title:", expected_title, end=" ")
@@ -1658,11 +2962,10 @@ def test_page_entries(page_no, expected_title, expected_entries, test_entries):
             raise ValueError(f"Expected entries: {expected_entries} Actual entries: {len(entries)}")
 
 
-def test_page_chunks(page_no, expected_title, expected_paragraphs, headwords):
+def test_page_chunks(page_no, expected_title, expected_paragraphs, headwords, pool=None):
     print("Testing paragraphs, page", page_no)
-    with pikepdf.open(os.path.join(os.path.dirname(__file__), 'matica/matica-full.pdf')) as pdf:
-        page = pdf.pages[page_no]
-        decoder = PdfDecoderForPage(page, page_no)
+    with nullcontext(pool) if pool else TestPagesPool() as pool:
+        decoder = pool.decoder(page_no)
         chunks_page = decoder.convert_to_chunks_page()
 
         print("Title exists:", end=" ")
@@ -1700,175 +3003,140 @@ def test_page_chunks(page_no, expected_title, expected_paragraphs, headwords):
             exit(1)
 
 
-if __name__ == '__main__':
-    import argparse
-    import sys
-
-    parser = argparse.ArgumentParser(description='Парсер за Матицу Српску')
-
-    parser.add_argument('--debug', default=None,
-                        help='Приказивање дебаг информација: --debug page_no:entry_no')
-    parser.add_argument('--progress', action='store_true',
-                        help='Приказивање прогреса')
-    parser.add_argument('--positions', action='store_true',
-                        help='Приказивање позиција у PDF-у')
-    parser.add_argument('--txt', action='store_true',
-                        help='Екстракција свих страна из PDF-а у текстуални фајл')
-    parser.add_argument('--csv', action='store_true',
-                        help='Екстракција свих страна из PDF-а у SCV фајл')
-    parser.add_argument('--csv-lookup', action='store_true',
-                        help='Екстракција свих страна из PDF-а у SCV фајл са lookup poljem')
-    parser.add_argument('--json', action='store_true',
-                        help='Екстракција свих страна из PDF-а у JSON фајл')
-    parser.add_argument('--json-lookup', action='store_true',
-                        help='Екстракција свих страна из PDF-а у JSON фајл са lookup poljem')
-    parser.add_argument('--mongodb-connection-string', default=None,
-                        help='Екстракција свих страна из PDF-а у mongodb')
-    parser.add_argument('--firebase-service-account-key-json', default=None,
-                        help='Екстракција свих страна из PDF-а у firebase real-time database')
-
-    args = parser.parse_args()
-
-    debug_progress = args.progress
-
-    convertor = PdfDecoderForFile(os.path.join(os.path.dirname(__file__), 'matica/matica-full.pdf'))
-
-    if args.txt:
-        convertor.print_txt()
-        exit(0)
-
-    if args.positions:
-        print('Not implemented')
-        exit(1)
-
-    if args.csv:
-        convertor.print_csv()
-        exit(0)
-
-    if args.csv_lookup:
-        convertor.print_csv(lookup=True)
-        exit(0)
-
-    if args.json:
-        convertor.print_json()
-        exit(0)
-
-    if args.json_lookup:
-        convertor.print_json(lookup=True)
-        exit(0)
-
-    if args.mongodb_connection_string:
-        from pymongo import MongoClient
-
-        convertor.export_mongodb(args.mongodb_connection_string)
-        exit(0)
-
-    if args.firebase_service_account_key_json:
-        import firebase_admin
+# (test, page_no, expected title, expected number of entries or paragraphs, [Th]) of the regression tests
+# every cid shown on the page is found in RawChunksDatabase, also the ones of the title outside the paragraphs
+def test_page_raw_database(page_no, expected_title, pool=None):
+    print("Testing raw database, page", page_no)
+    with nullcontext(pool) if pool else TestPagesPool() as pool:
+        decoder = pool.decoder(page_no)
+        chunks_page = decoder.convert_to_chunks_page()
+        database = RawChunksDatabase(':memory:')
+        database.add_page(page_no, chunks_page.title(), chunks_page.chunks_paragraphs, decoder.font_decoders,
+                          decoder.raw_chunks())
 
-        convertor.export_firebase(args.firebase_service_account_key_json)
-        exit(0)
+        print("Expected title:", expected_title, end=" ")
+        if database.title(page_no) == expected_title:
+            print("PASSED")
+        else:
+            print("FAILED. Actual title:", database.title(page_no))
+            raise ValueError(f"Expected title: {expected_title} Actual title: {database.title(page_no)}")
+
+        in_paragraphs = {(chunk.font, cid) for paragraph in chunks_page.chunks_paragraphs for line in paragraph.lines
+                         for chunk in line for cid in decoder.font_decoders[chunk.font].cids(chunk.cids)}
+        title_only = {(chunk.font, cid) for chunk in chunks_page.chunks_title
+                      for cid in decoder.font_decoders[chunk.font].cids(chunk.cids)} - in_paragraphs
+        print(f"Title only cids ({len(title_only)}):", end=" ")
+        missing = [(font, cid) for font, cid in sorted(title_only) if database.pages_with_cid(font, cid) != [page_no]]
+        if len(missing) == 0:
+            print("PASSED")
+        else:
+            print("FAILED. Not found:", missing)
+            raise ValueError(f"Title cids not found: {missing}")
+
+        print("All cids:", end=" ")
+        missing = [(font, cid) for font, cids in sorted(decoder.used_cids().items()) for cid in sorted(cids)
+                   if database.pages_with_cid(font, cid) != [page_no]]
+        database.close()
+        if len(missing) == 0:
+            print("PASSED")
+        else:
+            print("FAILED. Not found:", missing)
+            raise ValueError(f"Cids not found: {missing}")
 
-    if args.debug:
-        page_no, entry_no_or_headword = args.debug.split(':')
-        convertor.debug_entry(int(page_no), int(entry_no_or_headword))
-        exit(0)
-    #################### TESTST #########################
-    convertor.debug_entry(18, 6)
-    exit(0)
 
-    problem_titles = [154, 660, 772, 774, 796, 1010, 1330]
+def test_cases():
+    cases = []
 
     test_entries = [
         Th(0, "надометнути"),
         Th(40, "надридуховит"),
     ]
-    test_page_entries(751, "750 НАДОМЕТНУТИ -НАДРИДУХОВИТ", 41, test_entries)
+    cases.append(('entries', 751, "750 НАДОМЕТНУТИ -НАДРИДУХОВИТ", 41, test_entries))
 
     test_entries = [
         Th(0, "позитрон"),
         Th(48, "пој"),
     ]
-    test_page_entries(944, "ПО3ИТРОН -ПОЈ 943", 49, test_entries)
+    cases.append(('entries', 944, "ПО3ИТРОН -ПОЈ 943", 49, test_entries))
 
     test_entries = [
         Th(0, "подсетник"),
         Th(61, "подужи"),
     ]
-    test_page_entries(940, "ПОДСЕТНИК -ПОДУЖИ 939", 62, test_entries)
+    cases.append(('entries', 940, "ПОДСЕТНИК -ПОДУЖИ 939", 62, test_entries))
 
     test_entries = [
         Th(0, "галиматијас"),
         Th(55, "гањивати (се)"),
     ]
-    test_page_entries(175, "174 ГАЛИМАТИЈАС -ГАЊИВАТИ (СЕ)", 56, test_entries)
+    cases.append(('entries', 175, "174 ГАЛИМАТИЈАС -ГАЊИВАТИ (СЕ)", 56, test_entries))
 
     test_entries = [
         Th(0, "осмак"),
         Th(53, "основац"),
     ]
 
-    test_page_entries(878, "ОСМАК -ОСНОВАЦ 877", 54, test_entries)
+    cases.append(('entries', 878, "ОСМАК -ОСНОВАЦ 877", 54, test_entries))
 
     test_entries = [
         Th(0, "задерати"),
         Th(57, "задоцњивати (се)"),
     ]
 
-    test_page_entries(374, "ЗАДЕРАТИ -ЗАДОЦЊИВАТИ (СЕ) 373", 58, test_entries)
+    cases.append(('entries', 374, "ЗАДЕРАТИ -ЗАДОЦЊИВАТИ (СЕ) 373", 58, test_entries))
 
     test_entries = [
         Th(0, "зацењивати (се)"),
         Th(56, "зачеће"),
     ]
 
-    test_page_entries(408, "ЗАЦЕЊИВАТИ (СЕ)l -ЗА ЧЕЋЕ 407", 57, test_entries)
+    cases.append(('entries', 408, "ЗАЦЕЊИВАТИ (СЕ)l -ЗА ЧЕЋЕ 407", 57, test_entries))
 
     test_entries = [
         Th(0, "затирати (се)"),
         Th(53, "затрести"),
     ]
 
-    test_page_entries(404, "3АТИРАТИ(СЕ)-3АТРЕСТИ 403", 54, test_entries)
+    cases.append(('entries', 404, "3АТИРАТИ(СЕ)-3АТРЕСТИ 403", 54, test_entries))
 
     test_entries = [
         Th(0, "заозбиљно"),
         Th(53, "западно"),
     ]
 
-    test_page_entries(390, "ЗАОЗБИЉНО -ЗАПАДНО 389", 54, test_entries)
+    cases.append(('entries', 390, "ЗАОЗБИЉНО -ЗАПАДНО 389", 54, test_entries))
 
     test_entries = [
         Th(0, "дiшилац"),
         Th(45, "дактилоскопија"),
     ]
 
-    test_page_entries(230, "ДАВИЛАЦ -ДАКТИЛОСКОПИЈА 229", 46, test_entries)
+    cases.append(('entries', 230, "ДАВИЛАЦ -ДАКТИЛОСКОПИЈА 229", 46, test_entries))
 
     test_entries = [
         Th(0, ""),
         Th(19, "водено"),
     ]
 
-    test_page_entries(152, "ВОДАН -ВОДЕНО 151", 20, test_entries)
+    cases.append(('entries', 152, "ВОДАН -ВОДЕНО 151", 20, test_entries))
 
     test_entries = [
         Th(0, "гарниmна"),
         Th(52, "гатити"),
     ]
-    test_page_entries(177, "176 ГАРНИШНА -ГАТИТИ", 53, test_entries)
+    cases.append(('entries', 177, "176 ГАРНИШНА -ГАТИТИ", 53, test_entries))
 
     test_entries = [
         Th(0, ""),
         Th(55, "гвожђурина"),
     ]
-    test_page_entries(178, "ГАТИЋ -ГВОЖЂУРИНА 177", 56, test_entries)
+    cases.append(('entries', 178, "ГАТИЋ -ГВОЖЂУРИНА 177", 56, test_entries))
 
     test_entries = [
         Th(0, "гаовица"),
         Th(47, "гарнитура"),
     ]
-    test_page_entries(176, "ГАОВИЦА-ГАРНИТУРА 175", 48, test_entries)
+    cases.append(('entries', 176, "ГАОВИЦА-ГАРНИТУРА 175", 48, test_entries))
 
     test_entries = [
         Th(0, "",
@@ -1876,13 +3144,13 @@ if __name__ == '__main__':
         Th(1, "аминати"),
         Th(49, "амфитеатралан"),
     ]
-    test_page_chunks(31, "30 АМИНАТИ -АМФИТЕАТРАЛАН", 50, test_entries)
-    test_page_entries(31, "30 АМИНАТИ -АМФИТЕАТРАЛАН", 50, test_entries)
+    cases.append(('chunks', 31, "30 АМИНАТИ -АМФИТЕАТРАЛАН", 50, test_entries))
+    cases.append(('entries', 31, "30 АМИНАТИ -АМФИТЕАТРАЛАН", 50, test_entries))
 
     test_entries = [
         Th(61, "архијерејскй"),
     ]
-    test_page_entries(45, "44 АРТИЉЕРИЈСКИ -АРХИЈЕРЕЈСКИ", 62, test_entries)
+    cases.append(('entries', 45, "44 АРТИЉЕРИЈСКИ -АРХИЈЕРЕЈСКИ", 62, test_entries))
 
     test_entries = [
         Th(0, "а1"),
@@ -1898,19 +3166,19 @@ if __name__ == '__main__':
         Th(29, "абонент"),
         Th(30, "абонеНТRиња"),
     ]
-    test_page_entries(16, "А", 34, test_entries)
+    cases.append(('entries', 16, "А", 34, test_entries))
 
     test_entries = [
         Th(12, "архитектоника"),
         Th(13, "архитектонички и архитектонични"),
         Th(58, "асинхронија"),
     ]
-    test_page_entries(46, "АРХИЛАЖАЦ -АСИНХРОНИЈА 45", 59, test_entries)
+    cases.append(('entries', 46, "АРХИЛАЖАЦ -АСИНХРОНИЈА 45", 59, test_entries))
 
     test_entries = [
     ]
-    test_page_entries(27, "26 АЛЕЛУЈА -АЛКУРАН", 47, test_entries)
-    test_page_chunks(27, "26 АЛЕЛУЈА -АЛКУРАН", 47, test_entries)
+    cases.append(('entries', 27, "26 АЛЕЛУЈА -АЛКУРАН", 47, test_entries))
+    cases.append(('chunks', 27, "26 АЛЕЛУЈА -АЛКУРАН", 47, test_entries))
 
     test_entries = [
         Th(0, "амфитеатрално"),
@@ -1923,8 +3191,8 @@ if __name__ == '__main__':
         Th(28, "аналитичност"),
         Th(56, "анархичност"),
     ]
-    test_page_chunks(32, "АМФИТЕАТРАЛНО -АНАРХИЧНОСТ 31", 57, test_entries)
-    test_page_entries(32, "АМФИТЕАТРАЛНО -АНАРХИЧНОСТ 31", 57, test_entries)
+    cases.append(('chunks', 32, "АМФИТЕАТРАЛНО -АНАРХИЧНОСТ 31", 57, test_entries))
+    cases.append(('entries', 32, "АМФИТЕАТРАЛНО -АНАРХИЧНОСТ 31", 57, test_entries))
 
     test_para = [
         Th(0, "аерорели"),
@@ -1943,7 +3211,7 @@ if __name__ == '__main__':
         Th(50, "аја"),
         Th(67, "ајурведа"),
     ]
-    test_page_chunks(21, '20 АЕРОРЕЛИ -АЈУРВЕДА', 68, test_para)
+    cases.append(('chunks', 21, '20 АЕРОРЕЛИ -АЈУРВЕДА', 68, test_para))
     test_para = [
         Th(0, "анархо-"),
         Th(1, "анархолиберал"),
@@ -1952,13 +3220,13 @@ if __name__ == '__main__':
         Th(28, "ангелика"),
         Th(56, "англофопски"),
     ]
-    test_page_chunks(33, '32 АНАРХО--АНГЛОФОПСКИ', 57, test_para)
+    cases.append(('chunks', 33, '32 АНАРХО--АНГЛОФОПСКИ', 57, test_para))
 
     test_entries = [
         Th(0, ""),
         Th(47, "вёровати"),
     ]
-    test_page_entries(133, "132 ВЕРАН -ВЕРОВАТИ", 48, test_entries)
+    cases.append(('entries', 133, "132 ВЕРАН -ВЕРОВАТИ", 48, test_entries))
 
     test_entries = [
         Th(10, "баздети"),
@@ -1972,37 +3240,279 @@ if __name__ == '__main__':
         Th(40, "бајити"),
         Th(46, "бајно"),
     ]
-    test_page_entries(57, "56 БАЖДАРИТИ -БАЈНО", 47, test_entries)
+    cases.append(('entries', 57, "56 БАЖДАРИТИ -БАЈНО", 47, test_entries))
 
     test_entries = [
         Th(55, "беседа"),
     ]
-    test_page_entries(76, "БЕРБАНСКИ -БЕСЕДА 75", 56, test_entries)
-
-#    matica_pdf = os.path.join(os.path.dirname(__file__), 'matica/matica-full.pdf')
-#    with pikepdf.open(matica_pdf) as pdf:
-#        prev_entries = []
-#        for n, page in enumerate(pdf.pages, start=1):
-#            # print(f"Page =========> {n}")
-#            if n < 33:
-#                continue
-#            if n > 33:
-#                break
-#            # if n> 20:
-#            #    break
-#            # if n < 21:
-#            #    continue
-#            # if n > 21:
-#            #    break
-#            if (page["/Resources"].get("/Font", None) is None):
-#                print(f"No fonts found in page resources for page: {n}")
-#                continue
-#            decoder = PdfDecoderForPage(page, n, fixes, typos)
-#            decoder.debug_text()
-#            decoder.convert_to_chunks()
-#            # print(''.join([(a.is_headword and "\n=>" or "") + a.text for a in decoder.convert_to_chunks()]))
-#
-#            #entries = decoder.convert_to_entries(prev_entries)
-#            # print(''.join(["=>" + str(a) + "\n" for a in prev_entries]))
-#            prev_entries = entries
-#        #print(''.join(["=>" + str(a) + "\n" for a in prev_entries]))
+    cases.append(('entries', 76, "БЕРБАНСКИ -БЕСЕДА 75", 56, test_entries))
+
+    cases.append(('raw-db', 33, '32 АНАРХО--АНГЛОФОПСКИ', None, None))
+    cases.append(('raw-db', 751, "750 НАДОМЕТНУТИ -НАДРИДУХОВИТ", None, None))
+    return cases
+
+
+class TestPagesPool:
+    """
+    The pages of the book for the regression tests. The PDF is opened once and every page is decoded once,
+    so the entries and the paragraphs tests of a page share its ChunksPage.
+    The pages are decoded without the fixes for easier comparision with PDF.
+    """
+
+    def __init__(self, pdf_file=None):
+        self.pdf = pikepdf.open(pdf_file or os.path.join(os.path.dirname(__file__), 'matica/matica-full.pdf'))
+        self.decoders = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.pdf.close()
+
+    def decoder(self, page_no):
+        decoder = self.decoders.get(page_no)
+        if decoder is None:
+            decoder = PdfDecoderForPage(self.pdf.pages[page_no], page_no)
+            self.decoders[page_no] = decoder
+        return decoder
+
+
+# runs the cases with one pool, returns the output if captured and the failure if any
+def _run_test_cases(cases, capture=False):
+    out = io.StringIO() if capture else sys.stdout
+    failure = None
+    with redirect_stdout(out), TestPagesPool() as pool:
+        for test, page_no, expected_title, expected, tests in cases:
+            try:
+                if test == 'entries':
+                    test_page_entries(page_no, expected_title, expected, tests, pool)
+                elif test == 'raw-db':
+                    test_page_raw_database(page_no, expected_title, pool)
+                else:
+                    test_page_chunks(page_no, expected_title, expected, tests, pool)
+            except (ValueError, SystemExit) as e:
+                failure = f"{test} of page {page_no}: {e}"
+                break
+    return out.getvalue() if capture else '', failure
+
+
+# Runs test_cases, with several workers the pages are split between processes, each opens the PDF once.
+# Returns True if all the tests passed
+def run_tests(workers=1):
+    cases = test_cases()
+    if workers <= 1:
+        _, failure = _run_test_cases(cases)
+        failures = [] if failure is None else [failure]
+    else:
+        pages = sorted({case[1] for case in cases})
+        shards = [[case for case in cases if case[1] in pages[i::workers]] for i in range(workers)]
+        failures = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(_worker_settings(),)) as executor:
+            for output, failure in executor.map(_run_test_cases, shards, [True] * len(shards)):
+                print(output, end='')
+                if failure is not None:
+                    failures.append(failure)
+    for failure in failures:
+        print(f"FAILED {failure}")
+    return len(failures) == 0
+
+
+if __name__ == '__main__':
+    import argparse
+    import atexit
+
+    parser = argparse.ArgumentParser(description='Парсер за Матицу Српску')
+
+    parser.add_argument('--debug', action='append', default=None,
+                        help='Приказивање дебаг информација: --debug page_no:entry_no[,page_no:headword...],'
+                             ' може се задати више пута')
+    parser.add_argument('--progress', action='store_true',
+                        help='Приказивање прогреса')
+    parser.add_argument('--layout', choices=['python', 'numpy'], default='python',
+                        help='Алгоритам за одређивање линија, колона и пасуса (numpy захтева NumPy)')
+    parser.add_argument('--indent-detector', choices=['iterative', 'fit'], default='iterative',
+                        help='Начин одређивања увлачења и размака између пасуса')
+    parser.add_argument('--timings', action='store_true',
+                        help='Приказивање времена по фазама конверзије за сваку страну')
+    parser.add_argument('--stats', default=None,
+                        help='JSON фајл са бројачима и временима фаза на крају конверзије')
+    parser.add_argument('--positions', nargs='?', const=os.path.join(os.path.dirname(__file__), 'matica/positions.bin'),
+                        default=None,
+                        help='Бинарни фајл са позицијама свих делова у PDF-у (за positions.py)')
+    parser.add_argument('--raw-db', default=None,
+                        help='SQLite база сирових делова, позиција и мапирања прочитаних из PDF-а')
+    parser.add_argument('--cid', default=None,
+                        help='Стране у --raw-db бази на којима се појављује CID: --cid /C0_4:0ce4')
+    parser.add_argument('--glitches', default=None,
+                        help='JSON фајл са додатним OSR грешкама (види GlitchTable)')
+    parser.add_argument('--chunks-cache', default=None,
+                        help='Директоријум за кеш сирових делова страна прочитаних из PDF-а')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Број процеса за паралелну конверзију страна и за --test')
+    parser.add_argument('--test', action='store_true',
+                        help='Регресиони тестови на странама из test_cases()')
+    parser.add_argument('--txt', action='store_true',
+                        help='Екстракција свих страна из PDF-а у текстуални фајл')
+    parser.add_argument('--csv', action='store_true',
+                        help='Екстракција свих страна из PDF-а у SCV фајл')
+    parser.add_argument('--csv-lookup', action='store_true',
+                        help='Екстракција свих страна из PDF-а у SCV фајл са lookup poljem')
+    parser.add_argument('--json', action='store_true',
+                        help='Екстракција свих страна из PDF-а у JSON фајл')
+    parser.add_argument('--json-lookup', action='store_true',
+                        help='Екстракција свих страна из PDF-а у JSON фајл са lookup poljem')
+    parser.add_argument('--prefix-index', default=None,
+                        help='Сортирани индекс речи за претрагу по префиксу уз --json: --json --prefix-index index.json')
+    parser.add_argument('--prefix-lookup', default=None,
+                        help='Претрага --prefix-index индекса по префиксу речи')
+    parser.add_argument('--ndjson', action='store_true',
+                        help='Екстракција свих страна из PDF-а у NDJSON фајл, један унос по линији')
+    parser.add_argument('--ndjson-lookup', action='store_true',
+                        help='Екстракција свих страна из PDF-а у NDJSON фајл са lookup poljem')
+    parser.add_argument('--sqlite', default=None,
+                        help='Екстракција свих страна из PDF-а у SQLite фајл са индексом речи и FTS5 претрагом')
+    parser.add_argument('--incremental', default=None,
+                        help='Инкрементална конверзија у JSON или CSV фајл: --json --incremental path/to/output.json')
+    parser.add_argument('--watch', nargs='?', type=float, const=1.0, default=None,
+                        help='Уз --incremental: поново при свакој измени фајла исправки, провера на задати број секунди')
+    parser.add_argument('--fixups', default=FIXUPS_FILE,
+                        help='JSON фајл са исправкама CID-ова и словних грешака по фонтовима')
+    parser.add_argument('--mongodb-connection-string', default=None,
+                        help='Екстракција свих страна из PDF-а у mongodb')
+    parser.add_argument('--mongodb-batch-size', type=int, default=MONGODB_BATCH_SIZE,
+                        help='Број уноса по једном упису у mongodb')
+    parser.add_argument('--firebase-service-account-key-json', default=None,
+                        help='Екстракција свих страна из PDF-а у firebase real-time database')
+    parser.add_argument('--async-export', action='store_true',
+                        help='Упис у mongodb или firebase истовремено са конверзијом (asyncio)')
+    parser.add_argument('--async-writers', type=int, default=ASYNC_WRITERS,
+                        help='Број истовремених уписа за --async-export')
+    parser.add_argument('--firebase-batch-size', type=int, default=FIREBASE_BATCH_SIZE,
+                        help='Број уноса по једном упису у firebase')
+    parser.add_argument('--firebase-workers', type=int, default=FIREBASE_WORKERS,
+                        help='Број истовремених уписа у firebase')
+
+    args = parser.parse_args()
+
+    debug_progress = args.progress
+    debug_timings = args.timings
+    layout_engine = args.layout
+    indent_detector_mode = args.indent_detector
+    reload_fixups(args.fixups)
+    if args.glitches:
+        glitches.extend(args.glitches)
+    if args.chunks_cache:
+        chunks_cache = ChunksCache(args.chunks_cache)
+    if args.stats:
+        counters = Counters()
+
+    convertor = PdfDecoderForFile(os.path.join(os.path.dirname(__file__), 'matica/matica-full.pdf'),
+                                  workers=args.workers)
+    if counters is not None:
+        # every mode ends with exit(), the report is written on the way out
+        atexit.register(counters.save, args.stats, convertor.timings)
+
+    if args.incremental:
+        if args.json or args.json_lookup:
+            fmt, lookup = 'json', args.json_lookup
+        elif args.csv or args.csv_lookup:
+            fmt, lookup = 'csv', args.csv_lookup
+        else:
+            print('--incremental requires one of --json, --json-lookup, --csv, --csv-lookup', file=sys.stderr)
+            exit(1)
+        convertor.convert_incremental(args.incremental, fmt, lookup=lookup)
+        # the output follows the edits of the fixups file until interrupted
+        while args.watch:
+            time.sleep(args.watch)
+            try:
+                if reload_fixups(args.fixups):
+                    convertor.convert_incremental(args.incremental, fmt, lookup=lookup)
+            except ValueError as e:
+                print(f"Fixups not reloaded: {e}", file=sys.stderr)
+        exit(0)
+
+    if args.raw_db:
+        if args.cid:
+            font, cid = args.cid.split(':')
+            database = RawChunksDatabase(args.raw_db)
+            print(database.mapping(font, int(cid, 16)))
+            print(' '.join(str(n) for n in database.pages_with_cid(font, int(cid, 16))))
+            database.close()
+        else:
+            convertor.write_raw_database(args.raw_db)
+        exit(0)
+
+    if args.sqlite:
+        convertor.export_sqlite(args.sqlite)
+        exit(0)
+
+    if args.txt:
+        convertor.print_txt()
+        exit(0)
+
+    if args.positions:
+        convertor.write_positions(args.positions)
+        exit(0)
+
+    if args.csv:
+        convertor.print_csv()
+        exit(0)
+
+    if args.csv_lookup:
+        convertor.print_csv(lookup=True)
+        exit(0)
+
+    if args.prefix_index and args.prefix_lookup:
+        index = PrefixIndex.load(args.prefix_index)
+        for key, entry in index.lookup(PdfDecoderForFile.lookup_translator(args.prefix_lookup)):
+            print(f"{entry}\t{key}")
+        exit(0)
+
+    if args.json:
+        convertor.print_json(prefix_index=args.prefix_index)
+        exit(0)
+
+    if args.json_lookup:
+        convertor.print_json(lookup=True, prefix_index=args.prefix_index)
+        exit(0)
+
+    if args.ndjson:
+        convertor.print_ndjson()
+        exit(0)
+
+    if args.ndjson_lookup:
+        convertor.print_ndjson(lookup=True)
+        exit(0)
+
+    if args.mongodb_connection_string:
+        if args.async_export:
+            convertor.export_mongodb_async(args.mongodb_connection_string, batch_size=args.mongodb_batch_size,
+                                           writers=args.async_writers)
+        else:
+            convertor.export_mongodb(args.mongodb_connection_string, batch_size=args.mongodb_batch_size)
+        exit(0)
+
+    if args.firebase_service_account_key_json:
+        if args.async_export:
+            convertor.export_firebase_async(args.firebase_service_account_key_json,
+                                            batch_size=args.firebase_batch_size, writers=args.async_writers)
+        else:
+            convertor.export_firebase(args.firebase_service_account_key_json, batch_size=args.firebase_batch_size,
+                                      workers=args.firebase_workers)
+        exit(0)
+
+    if args.test:
+        exit(0 if run_tests(args.workers) else 1)
+
+    if args.debug:
+        specs = []
+        for spec in ','.join(args.debug).split(','):
+            page_no, entry_no_or_headword = spec.split(':', 1)
+            specs.append((int(page_no), int(entry_no_or_headword) if entry_no_or_headword.isdigit()
+                          else entry_no_or_headword))
+        convertor.debug_entries(specs)
+        exit(0)
+
+    parser.print_help()
+    exit(1)
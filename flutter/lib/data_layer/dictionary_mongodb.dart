@@ -42,14 +42,24 @@ class DictionaryMongodbProvider implements DictionaryProvider {
     _collection = _db.collection('entries');
   }
 
+  // the spaces and the ASCII punctuation (Python's string.punctuation) are
+  // dropped as normalise_lookup of the convertor does for the lookup field
+  static final _lookupDrop = RegExp(r"""[!"#$%&'()*+,\-./:;<=>?@\[\\\]^_`{|}~ ]+""");
+
+  static String _normalize(String s) {
+    return s.replaceAll(_lookupDrop, '').toLowerCase();
+  }
+
   @override
   Future<List<DictionaryEntry>> getEntriesByHeadwordBegin(
       String pattern) async {
     if (pattern.isEmpty) {
       return [];
     }
-    final regexPattern = '^$pattern';
-    final match = where.match('headword', regexPattern, caseInsensitive: true);
+    // the anchored case sensitive regex on the normalised lookup field is
+    // a range scan of its index
+    final regexPattern = '^${RegExp.escape(_normalize(pattern))}';
+    final match = where.match('lookup', regexPattern).sortBy('lookup');
     /*
     i want to see the match for "и"
     final count = await _collection.count(match);